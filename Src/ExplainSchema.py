@@ -0,0 +1,153 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Validation plan of a JSON schema, to see where the time of the validation goes
+###  the schema is shown as the tree of the checks done by ValidateJsonObject.validate with
+###  the references replaced by their definition (a definition is expanded once, the other references to it only
+###  show its cost), the recursion points, the number of alternatives, the patterns and their complexity,
+###  the number of required and optional keys, the subtrees that are not checked and the unreachable definitions.
+###  Each node has an estimated relative cost: 1 for the check of a value and 1 for each facet,
+###  PATTERN_COST or RISKY_PATTERN_COST for a pattern, arrays and objects with arbitrary keys count one element
+###  and all alternatives are counted (as when none matches)
+########################################################################
+
+from ValidateJsonObject import patternRisks,showNum
+from ppJson import ppJson
+
+PATTERN_COST=2
+RISKY_PATTERN_COST=50
+FACETS=["minimum","exclusiveMinimum","maximum","exclusiveMaximum","minLength","maxLength",
+        "minItems","maxItems","minProperties","maxProperties"]
+
+## complexity class and cost of the matching of a pattern
+def patternClass(pattern):
+    risks=patternRisks(pattern)
+    if len(risks)>0:
+        return ("exponential: "+", ".join(risks),RISKY_PATTERN_COST)
+    return ("linear",PATTERN_COST)
+
+###
+#  plan of a node of the schema: a dict with its label, its path (as in the error messages, with [*] for elements),
+#  its kind, a description, its estimated cost and its children
+#  state keeps the definitions expanded with their cost, the recursion points and the unconstrained subtrees
+def explainNode(node,label,path,stack,state):
+    plan={"label":label,"path":path}
+    if "$memo" in node: # memoized definition (see ValidateJsonObject.memoizeRefs)
+        node=node["schema"]
+    if "$ref" in node:
+        ref=node["$ref"]
+        name=ref[14:] if ref.startswith("#/definitions/") else ref
+        plan.update({"kind":"ref","ref":name})
+        if name in stack:
+            state["recursion"].append({"path":path,"ref":name})
+            plan.update({"description":"recursion to "+name,"cost":0})
+        elif name in state["costs"]:
+            plan.update({"description":"as above","cost":state["costs"][name]})
+        elif name not in state["definitions"]:
+            plan.update({"description":"no definition for "+name,"cost":0})
+        else:
+            state["costs"][name]=0 # for references within the definition to an enclosing one
+            sub=explainNode(state["definitions"][name],label,path,stack+[name],state)
+            state["costs"][name]=sub["cost"]
+            sub["ref"]=name
+            return sub
+        return plan
+    if "oneOf" in node:
+        alts=[explainNode(alt,"|"+str(no+1),path,stack,state) for (no,alt) in enumerate(node["oneOf"])]
+        plan.update({"kind":"oneOf","alternatives":len(alts),"description":"one of %d alternatives"%len(alts),
+                     "cost":1+sum([alt["cost"] for alt in alts]),"children":alts})
+        return plan
+    if len(node)==0:
+        state["unconstrained"].append(path)
+        plan.update({"kind":"any","description":"any value (not checked)","cost":0})
+        return plan
+    theType=node.get("type")
+    facets=[facet+"="+str(node[facet]) for facet in FACETS if facet in node]
+    cost=1+len(facets)
+    plan["kind"]=theType
+    if theType=="object":
+        addProps=node.get("additionalProperties")
+        if type(addProps) is dict:
+            child=explainNode(addProps,"*",(path+"/" if path!="" else "")+"*",stack,state)
+            plan.update({"description":"object with arbitrary keys","children":[child]})
+            cost+=child["cost"]
+        elif "properties" in node:
+            required=node.get("required",[])
+            children=[explainNode(props,key if key in required else key+"?",(path+"/" if path!="" else "")+key,stack,state)
+                      for (key,props) in node["properties"].items()]
+            nbRequired=len([key for key in node["properties"] if key in required])
+            plan.update({"required":nbRequired,"optional":len(children)-nbRequired,"children":children,
+                         "description":"object, %d required, %d optional"%(nbRequired,len(children)-nbRequired)+
+                                       (", other keys not checked" if addProps is True else "")})
+            facets=[] # as in validate, the number of properties is not checked with properties
+            cost=1+sum([child["cost"] for child in children])
+        else:
+            state["unconstrained"].append(path)
+            plan["description"]="object, keys not checked"
+    elif theType=="array":
+        if "items" in node:
+            child=explainNode(node["items"],"[*]",(path+"/" if path!="" else "")+"[*]",stack,state)
+            plan.update({"description":"array","children":[child]})
+            cost+=child["cost"]
+        else:
+            state["unconstrained"].append(path)
+            plan["description"]="array, elements not checked"
+            facets=[] # as in validate, facets are not checked without items
+            cost=1
+    else:
+        plan["description"]=str(theType)
+        if "pattern" in node:
+            (complexity,patternCost)=patternClass(node["pattern"])
+            plan.update({"pattern":node["pattern"],"patternClass":complexity})
+            facets.append("pattern=/%s/ (%s)"%(node["pattern"],complexity))
+            cost+=patternCost
+    if len(facets)>0:
+        plan["description"]+=" @("+", ".join(facets)+")"
+    plan["cost"]=cost
+    return plan
+
+## names of the definitions of a schema used by its root, with the state of explainNode
+def usedDefinitions(schema,state):
+    root={key:value for (key,value) in schema.items() if key not in ["$schema","definitions","title","description"]}
+    plan=explainNode(root,"start","",[],state)
+    return (plan,set(state["costs"]))
+
+## reports the plan of a schema: the tree of checks, the recursion points, the unconstrained subtrees,
+#  the unreachable definitions and the estimated cost of the validation of a record
+#  unprojected is the schema before its projection by --only and --skip, if any: its definitions that are 
+#  only outside the selected paths are then reported as not used by the projection instead of unreachable
+def explainSchema(schema,unprojected=None):
+    state={"definitions":schema.get("definitions",{}),"costs":{},"recursion":[],"unconstrained":[]}
+    (plan,used)=usedDefinitions(schema,state)
+    report={"cost":plan["cost"],"plan":plan,"recursion":state["recursion"],"unconstrained":state["unconstrained"],
+            "unreachable":[name for name in state["definitions"] if name not in used]}
+    if unprojected!=None:
+        definitions=unprojected.get("definitions",{})
+        (_,reachable)=usedDefinitions(unprojected,{"definitions":definitions,"costs":{},"recursion":[],"unconstrained":[]})
+        report["unreachable"]=[name for name in definitions if name not in reachable]
+        report["notProjected"]=[name for name in definitions if name in reachable and name not in used]
+    return report
+
+def printPlanNode(out,plan,indent):
+    ref=" ("+plan["ref"]+")" if "ref" in plan else ""
+    print ("%10s  %s%s%s: %s"%(showNum(plan["cost"]),indent,plan["label"],ref,plan["description"]),file=out)
+    for child in plan.get("children",[]):
+        printPlanNode(out,child,indent+"   ")
+
+## print the report of explainSchema in "text" or "json" format
+def printExplanation(out,report,format,title):
+    if format=="json":
+        ppJson(out,dict({"schema":title},**report))
+        return
+    print ("Validation plan of "+title,file=out)
+    print ("%10s  %s"%("cost","check"),file=out)
+    printPlanNode(out,report["plan"],"")
+    print ("Estimated relative cost of the validation of a record: "+showNum(report["cost"]),file=out)
+    if len(report["recursion"])>0:
+        print ("Recursion points: "+", ".join([(r["path"] or "start")+" to "+r["ref"] for r in report["recursion"]]),file=out)
+    if len(report["unconstrained"])>0:
+        print ("Unconstrained subtrees: "+", ".join([path or "start" for path in report["unconstrained"]]),file=out)
+    if len(report["unreachable"])>0:
+        print ("Unreachable definitions: "+", ".join(report["unreachable"]),file=out)
+    if len(report.get("notProjected",[]))>0:
+        print ("Definitions not used by the projection: "+", ".join(report["notProjected"]),file=out)
@@ -0,0 +1,158 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Optimization of a JSON schema done once before the validation
+###  - the references are linked to the nodes of their definitions, so the schema becomes a graph
+###    (with cycles for recursive definitions) and the definitions used once are inlined
+###  - the definitions that cannot be reached from the root are dropped
+###  - structurally identical subschemas are shared
+###  A reference {"$ref":ref, facets...} becomes {"$ref":ref,"schema":node} where node is the reference merged
+###  with its definition as ValidateJsonObject.validate used to do when it met the reference (the keys of the definition
+###  take precedence); a definition that is only another name (e.g. a = b) is merged with the definition it names.
+###  Each reference of the schema keeps its own link, so that the path of a value shows
+###  the reference the first time it is traversed (see ValidateJsonObject.RefTraversal) and the messages are the same.
+###  A reference that cannot be found (or a circular chain of names) becomes {"$ref":ref,"error":message}.
+###  The validation does not change the result, so it can be shared: its lists are tuples and
+###  no validator writes to its nodes.
+########################################################################
+
+## node referred to by a reference (e.g. #/definitions/name) and None, or None and the message of
+#  ValidateJsonObject.deref when it cannot be found
+def resolve(ref,schema):
+    node=None
+    for field in ref.split("/"):
+        if field=="#":
+            node=schema
+        elif type(node) is dict and field in node:
+            node=node[field]
+        else:
+            return (None,"could not find:"+field)
+    return (node,None)
+
+## check if a node of the schema is a reference, which is followed by ValidateJsonObject.validate
+def isRef(node):
+    return type(node) is dict and "$ref" in node and all(key not in node for key in ["$memo","oneOf","type"])
+
+## definition of a reference, following the definitions that are only other names, and the facets of the
+#  reference and of these names (the keys of a definition taking precedence), or None and an error message
+def resolveDefinition(ref,schema):
+    facets={key:value for (key,value) in ref.items() if key!="$ref"}
+    names=set()
+    (target,error)=resolve(ref["$ref"],schema)
+    while error==None and isRef(target):
+        if id(target) in names:
+            return (None,None,"circular definition:"+target["$ref"])
+        names.add(id(target))
+        facets.update({key:value for (key,value) in target.items() if key!="$ref"})
+        (target,error)=resolve(target["$ref"],schema)
+    return (target,facets,error)
+
+## the facets of a reference merged with its definition
+def withDefinition(facets,target):
+    merged=dict(facets)
+    merged.update(target)
+    merged.pop("$ref",None)
+    return merged
+
+## deep copy of a value of the schema with tuples instead of lists
+def freeze(value):
+    if type(value) is dict:
+        return {key:freeze(v) for (key,v) in value.items()}
+    if type(value) is list:
+        return tuple([freeze(v) for v in value])
+    return value
+
+## key of a value for sharing identical nodes: built from the scalars (with their type so that 1, 1.0 and true
+#  are distinguished) and the ids of the nodes, which are already shared, and of other objects (e.g. caches)
+def structureKey(value):
+    if type(value) is tuple:
+        return (tuple,tuple([structureKey(v) for v in value]))
+    if type(value) in [str,int,float,bool] or value==None:
+        return (type(value),value)
+    return id(value)
+
+###
+#  optimize a schema read from a JSON-RNC file (possibly projected and with memoized definitions)
+#  the definitions referred to without facets are optimized once from a work list, so that long chains
+#  of references do not recurse
+#  returns a new schema whose "definitions" are the nodes linked at many places
+def optimizeSchema(schema):
+    built={}     # (definition, its node) by the id of the definition, the node is filled when taken from the work list
+    todo=[]      # definitions whose node is not filled
+    unique={}    # shared node of each structure
+    links={}     # (reference, its link) by the id of the reference, the reference is kept so that its id is not reused
+
+    def intern(node):
+        key=tuple([(k,structureKey(v)) for (k,v) in node.items()])
+        return unique.setdefault(key,node)
+
+    def link(ref):
+        if id(ref) in links:
+            return links[id(ref)][1]
+        res={"$ref":ref["$ref"]}
+        links[id(ref)]=(ref,res)
+        (target,facets,error)=resolveDefinition(ref,schema)
+        if error!=None:
+            res["error"]=error
+        elif len(facets)==0: # merged with the definition only
+            if id(target) not in built:
+                built[id(target)]=(target,{})
+                todo.append(target)
+            res["schema"]=built[id(target)][1]
+        else:
+            res["schema"]=optimizeNode(withDefinition(facets,target))
+        return res
+
+    def optimizeNode(node):
+        if type(node) is list:
+            return tuple([optimizeNode(elem) for elem in node])
+        if type(node) is not dict:
+            return node
+        if isRef(node):
+            return link(node)
+        return intern(optimizeContent({},node))
+
+    ## fill a node with the optimized keys of a node of the schema
+    def optimizeContent(res,node):
+        for (key,value) in node.items():
+            if key=="properties":
+                value=intern({field:optimizeNode(prop) for (field,prop) in value.items()})
+            elif key in ["oneOf","items","additionalProperties","schema"]:
+                value=optimizeNode(value)
+            elif key=="required": # a dict keeps the order of the messages and gives a constant time lookup
+                value=unique.setdefault(("required",tuple(value)),dict.fromkeys(value))
+            elif key!="$memo": # the cache of a memoized definition is kept
+                value=freeze(value)
+            res[key]=value
+        return res
+
+    top={key:value for (key,value) in schema.items() if key!="definitions"}
+    if isRef(top):
+        root=link(top)
+        if "$schema" in top:
+            root["$schema"]=top["$schema"]
+    else:
+        root=optimizeContent({},top)
+    while len(todo)>0:
+        target=todo.pop()
+        optimizeContent(built[id(target)][1],{key:value for (key,value) in target.items() if key!="$ref"})
+    counts=linkCounts(root)
+    root["definitions"]={name:built[id(d)][1] for (name,d) in schema.get("definitions",{}).items()
+                         if id(d) in built and counts.get(id(built[id(d)][1]),0)>1}
+    return root
+
+## number of links to each node of a graph (by id), each node being visited once
+def linkCounts(root):
+    links={}
+    stack=[root]
+    while len(stack)>0:
+        node=stack.pop()
+        for value in (node.values() if type(node) is dict else node):
+            if type(value) is dict or type(value) is tuple:
+                key=id(value)
+                if key in links:
+                    links[key]+=1
+                else:
+                    links[key]=1
+                    stack.append(value)
+    return links
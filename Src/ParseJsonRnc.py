@@ -26,63 +26,56 @@ RESERVED={"integer":"INTEGER","number":"NUMBER","string":"STRING",
           "null":"NULL","boolean":"BOOLEAN","start":"START"}
 LETTRES = "A-Za-zèêéàâçîôùïëüÈÊÉÀÂÇÎÔÙÏËÜ"  # lettres et lettres accentuées
 
-def tokenizeRNC(input):
-    token_specification = [
-        # escaped quoted string regex taken from http://stackoverflow.com/questions/16130404/regex-string-and-escaped-quote
-        ("STR",           r'"(?:\\.|[^"\\])*?"'+"|"+ r"'(?:\\.|[^'\\])*?'"),# double or single quoted string
-        ("REGEX",         r"/.*?/"),                    # regex
-        ("NUMBER",        r'-?\d+(\.\d*)?'),              # integer or decimal number
-        ("IDENT",         f'[{LETTRES}_][-{LETTRES}_0-9]*'),   # Identifiers
-        ("INTERROGATION", r'\?'),
-        ("OPEN_BRACE",    r'\{'),
-        ("CLOSE_BRACE",   r'\}'),
-        ("OPEN_BRACKET",  r'\['),
-        ("CLOSE_BRACKET", r'\]'),
-        ("OPEN_PAREN",    r'\('),
-        ("CLOSE_PAREN",   r'\)'),
-        ("VERT_BAR",      r'\|'),
-        ("EQUAL",         r'='),
-        ("STAR",          r'\*'),
-        ("AT",            r'@'),
-        ("COMMA",         r','),
-        ("COLON",         r':'),
-        ("EOL",           r'\n'),
-        ("SKIP",          r'[ \t]+|#.*'),  # Skip over spaces and tabs and comments
-        ("UNDEF",         r'.')            # Any other character
-    ]
-    tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
-    line_num = 1
-    line_start = 0
-    for mo in re.finditer(tok_regex, input):
-        kind = mo.lastgroup
-        value = mo.group(kind)
-        # print ("kind:"+kind+"; value:"+value)
-        if kind == "EOL":
-            line_start = mo.end()
-            line_num += 1
-        elif kind == "SKIP":
-            pass
-        elif kind == "UNDEF":
-            yield Token("UNDEF",value,line_num,mo.start()-line_start)
-        else:
-            if kind == "IDENT" and value in RESERVED:
-                kind = RESERVED[value]
-            column = mo.start() - line_start
-            yield Token(kind, value, line_num, column)
-    yield Token("EOF"," ",line_num,0)
+## punctuation tokens
+PUNCTUATION={"?":"INTERROGATION","{":"OPEN_BRACE","}":"CLOSE_BRACE","[":"OPEN_BRACKET","]":"CLOSE_BRACKET",
+             "(":"OPEN_PAREN",")":"CLOSE_PAREN","|":"VERT_BAR","=":"EQUAL","*":"STAR","@":"AT",",":"COMMA",":":"COLON"}
+TOKEN_SPECIFICATION = [ # the most frequent tokens first, the starts of the others do not overlap
+    ("IDENT",         f'[{LETTRES}_][-{LETTRES}_0-9]*'),   # Identifiers
+    ("PUNCT",         r'[?{}\[\]()|=*@,:]'),            # see PUNCTUATION
+    ("EOL",           r'\n'),
+    # escaped quoted string regex taken from http://stackoverflow.com/questions/16130404/regex-string-and-escaped-quote
+    ("STR",           r'"(?:\\.|[^"\\])*?"'+"|"+ r"'(?:\\.|[^'\\])*?'"),# double or single quoted string
+    ("NUMBER",        r'-?\d+(?:\.\d*)?'),            # integer or decimal number
+    ("REGEX",         r"/.*?/"),                    # regex
+    ("UNDEF",         r'.')            # Any other character
+]
+# spaces, tabs and a comment are skipped before each token, the token is the last group matched
+# (no group is matched for spaces or a comment at the end of the input)
+TOKEN_REGEX = re.compile(r'[ \t]*(?:#.*)?(?:'+'|'.join('(?P<%s>%s)' % pair for pair in TOKEN_SPECIFICATION)+')?')
 
 class Token:
     """packaging for the output of token"""
-    def __init__(self, kind,value,line_num,column):
+    __slots__=("kind","value","line_num","column","line_start")
+    def __init__(self, kind,value,line_num,column,line_start):
         self.kind=kind
         self.value=value
         self.line_num=line_num
         self.column=column
-        # print self
+        self.line_start=line_start # position of the start of the line in the input for error messages
     
     def __repr__(self):
         return "Token(%s:%s:%d:%d)"%(self.kind,self.value,self.line_num,self.column)
 
+def tokenizeRNC(input):
+    line_num = 1
+    line_start = 0
+    for mo in TOKEN_REGEX.finditer(input):
+        kind = mo.lastgroup
+        if kind == "EOL":
+            line_start = mo.end()
+            line_num += 1
+            continue
+        if kind is None:
+            break
+        value = mo.group(kind)
+        column = mo.start(kind) - line_start
+        if kind == "IDENT":
+            kind = RESERVED.get(value,kind)
+        elif kind == "PUNCT":
+            kind = PUNCTUATION[value]
+        yield Token(kind, value, line_num, column, line_start)
+    yield Token("EOF"," ",line_num,0,line_start)
+
 ################################################################################################
 
 ### EBNF Grammar of the json-rnc input
@@ -122,20 +115,39 @@ refs = set([])
 
 token=None
 tokenizer=None
-lines=["**dummy**"] # lines of the input kept for error messages, line 0 added to make line numbers start at one...
+text="" # input kept for error messages, the line of a token is found from its line_start
 errorsInSchema=0
 
+## sets of token kinds, built once instead of at each token
+DEF_START = frozenset(["IDENT","STR","START"])
+PRIMITIVE = frozenset(["STRING","INTEGER","NUMBER","BOOLEAN","NULL"])
+NAME      = frozenset(["IDENT","STR"])
+PROP_NEXT = frozenset(["COMMA","IDENT","STR","OPEN_PAREN"])
+
+## tokens on which the parsing resumes after an error (EOF is always included)
+def recovery(*kinds):
+    return frozenset(("EOF",)+kinds)
+AT_IDENT         = recovery("IDENT")
+AT_NAME          = recovery("IDENT","STR")
+AT_STR           = recovery("STR")
+AT_NUMBER        = recovery("NUMBER")
+AT_CLOSE_BRACE   = recovery("CLOSE_BRACE")
+AT_CLOSE_BRACKET = recovery("CLOSE_BRACKET")
+AT_CLOSE_PAREN   = recovery("CLOSE_PAREN")
+
 def errorJsrnc(module,message,recoveryTokens):
-    global lines,token,tokenizer,errorsInSchema,traceParse
+    global text,token,tokenizer,errorsInSchema,traceParse
     if traceParse:print( ">>>errorJsrnc:"+module)
     errorsInSchema+=1
-    line = lines[token.line_num] if token.line_num<len(lines) else ""
+    end = text.find("\n",token.line_start)
+    line = text[token.line_start:end+1] if end>=0 else text[token.line_start:]
     print ("line %3d: %s"%(token.line_num,line),end='')
     print (((token.column+10)*" ")+"↑:"+message)
     if recoveryTokens!=None:
-        endTokens=set(["EOF"]+recoveryTokens)
-        while token.kind not in endTokens:
+        kind=token.kind
+        while kind not in recoveryTokens:
             token=next(tokenizer)
+            kind=token.kind
 
 # definitions = "start" = type | {definition} ;
 # definition  = (identifier | string ) , ["=" , types] ;
@@ -144,11 +156,11 @@ def parseDef(): ## modifies the global schema variable
     if traceParse:print (">>>parseDef:"+str(token))
     is_start=False
     typedef=None
-    if token.kind in set(["IDENT","STR","START"]):
+    if token.kind in DEF_START:
         is_start=token.kind=="START"
         ident=token.value[1:-1] if token.kind=="STR" else token.value
     else:
-        errorJsrnc("parseDef","identifier expected at start of definition",["IDENT"])
+        errorJsrnc("parseDef","identifier expected at start of definition",AT_IDENT)
         ident="**dummy**"
     token=next(tokenizer)
     if token.kind=="EQUAL":
@@ -197,7 +209,7 @@ def parseType():
     global token,tokenizer,traceParse,refs
     if traceParse:print ("<<parseType:"+str(token))
     res=None
-    if token.kind in set(["STRING","INTEGER","NUMBER","BOOLEAN","NULL"]):
+    if token.kind in PRIMITIVE:
         res={"type":token.value}
         token=next(tokenizer)
         res=checkFacets(res)
@@ -229,7 +241,7 @@ def parseType():
                 token=next(tokenizer)
                 res=checkFacets(res)
             else:
-                errorJsrnc("parseType","closing brace expected",["CLOSE_BRACE"])
+                errorJsrnc("parseType","closing brace expected",AT_CLOSE_BRACE)
     elif token.kind == "OPEN_BRACKET":
         token=next(tokenizer)
         if token.kind == "CLOSE_BRACKET": ## skip array validation on []
@@ -242,16 +254,16 @@ def parseType():
                 token=next(tokenizer)
                 res=checkFacets(res)
             else:
-                errorJsrnc("parseType","closing bracket expected",["CLOSE_BRACKET"])
+                errorJsrnc("parseType","closing bracket expected",AT_CLOSE_BRACKET)
     elif token.kind == "OPEN_PAREN":
         token=next(tokenizer)
         res = parseTypes()
         if token.kind == "CLOSE_PAREN":
             token=next(tokenizer)
         else:
-            errorJsrnc("parseType","closing parenthesis expected",["CLOSE_PAREN"])
+            errorJsrnc("parseType","closing parenthesis expected",AT_CLOSE_PAREN)
     else:
-        errorJsrnc("parseType","ident or json type expected",["IDENT","STR"])
+        errorJsrnc("parseType","ident or json type expected",AT_NAME)
     if traceParse:print (">>parseType:"+str(res)    )
     return res
 
@@ -284,7 +296,7 @@ def parseProps(): ## => [{id:"nom",type:...,(optional:True)?}]
     global token,tokenizer,traceParse
     if traceParse:print ("<<parseProps:"+str(token))
     res = [parseProp()]
-    while token.kind in ["COMMA","IDENT","STR","OPEN_PAREN"]:
+    while token.kind in PROP_NEXT:
         if token.kind=="COMMA": token=next(tokenizer)
         res.append(parseProp())
     if traceParse:print (">>parseProps:"+str(res))
@@ -295,7 +307,7 @@ def parseProp(): ## => ({ident:type},optional[boolean],additionalProperty) | Non
     global token, tokenizer,traceParse,refs
     if traceParse:print ("<<parseProp:"+str(token))
     res=None
-    if token.kind in ["IDENT","STR"]:
+    if token.kind in NAME:
         ident=token.value if token.kind == "IDENT" else token.value[1:-1] # remove outer quotes
         token=next(tokenizer)
         optional=False
@@ -313,16 +325,16 @@ def parseProp(): ## => ({ident:type},optional[boolean],additionalProperty) | Non
             token=next(tokenizer)
             res=({},False,parseType())
         else:
-            errorJsrnc("parseProp","colon expected after *",["IDENT","STR"])
+            errorJsrnc("parseProp","colon expected after *",AT_NAME)
     elif token.kind=="OPEN_PAREN":
         token=next(tokenizer)
         res = parseProps()
         if token.kind == "CLOSE_PAREN":
             token=next(tokenizer)
         else:
-            errorJsrnc("parseProp","closing paren expected",["CLOSE_PAREN"])        
+            errorJsrnc("parseProp","closing paren expected",AT_CLOSE_PAREN)        
     else:
-        errorJsrnc("parseProp","ident, string or open parenthesis expected at the start of a prop",["IDENT","STR"])
+        errorJsrnc("parseProp","ident, string or open parenthesis expected at the start of a prop",AT_NAME)
     if traceParse:print (">>parseProp:"+str(res))
     return res
 
@@ -355,7 +367,7 @@ def parseFacets(theType):
     if token.kind=="OPEN_PAREN":
         token=next(tokenizer)
         while token.kind != "CLOSE_PAREN":
-            if token.kind in ["IDENT","STR"]:
+            if token.kind in NAME:
                 ident=token.value
                 if ident in ["minimum","maximum"]:
                     token=next(tokenizer)
@@ -367,9 +379,9 @@ def parseFacets(theType):
                             if theType!= None and ident in ["minimum","maximum"] and theType not in ["number","integer"]:
                                 errorJsrnc("parseFacets","facet "+ident+" only applicable to numeric types",None);
                         else: 
-                            errorJsrnc("parseFacets","number expected in facet "+ident,["NUMBER"])
+                            errorJsrnc("parseFacets","number expected in facet "+ident,AT_NUMBER)
                     else: 
-                        errorJsrnc("parseFacets","= expected in facet",["IDENT","STR"])
+                        errorJsrnc("parseFacets","= expected in facet",AT_NAME)
                 elif ident=="pattern":
                     token=next(tokenizer)
                     if token.kind == "EQUAL":
@@ -380,9 +392,9 @@ def parseFacets(theType):
                             if theType!= None and theType != "string":
                                 errorJsrnc("parseFacets","facet "+ident+" only applicable to string",None);
                         else:
-                            errorJsrnc("parseFacets"," string expected as pattern facet",["STR"])
+                            errorJsrnc("parseFacets"," string expected as pattern facet",AT_STR)
                     else: 
-                        errorJsrnc("parseFacets","= expected in facet",["IDENT","STR"])
+                        errorJsrnc("parseFacets","= expected in facet",AT_NAME)
                 elif ident == "exclusiveMinimum" or ident=="exclusiveMaximum":
                     token=next(tokenizer)
                     if token.kind == "EQUAL":
@@ -393,9 +405,9 @@ def parseFacets(theType):
                             if theType!= None and theType not in ["number","integer"]:
                                 errorJsrnc("parseFacets","facet "+ident+" only applicable to numeric types",None);
                         else: 
-                            errorJsrnc("parseFacets","number expected for facet "+ident,["STR"]) 
+                            errorJsrnc("parseFacets","number expected for facet "+ident,AT_STR) 
                     else: 
-                        errorJsrnc("parseFacets","= expected in facet",["IDENT","STR"])
+                        errorJsrnc("parseFacets","= expected in facet",AT_NAME)
                 elif ident in ["minItems","maxItems","minProperties","maxProperties","minLength","maxLength"]:
                     token=next(tokenizer)
                     if token.kind == "EQUAL":
@@ -410,20 +422,20 @@ def parseFacets(theType):
                             elif theType!= None and ident in ["minLength","maxLength"] and theType !="string":
                                 errorJsrnc("parseFacets","facet "+ident+" only applicable to string types",None);
                         else: 
-                            errorJsrnc("parseFacets","number expected in facet "+ident,["NUMBER"])
+                            errorJsrnc("parseFacets","number expected in facet "+ident,AT_NUMBER)
                     else: 
-                        errorJsrnc("parseFacets","= expected in facet",["IDENT","STR"])
+                        errorJsrnc("parseFacets","= expected in facet",AT_NAME)
                 else: 
-                    errorJsrnc("parseFacets","unrecognized facet:"+token.value,["IDENT","STR"])
+                    errorJsrnc("parseFacets","unrecognized facet:"+token.value,AT_NAME)
                     break
             else: 
-                errorJsrnc("parseFacets","identifier expected in facet",["IDENT","STR"])
+                errorJsrnc("parseFacets","identifier expected in facet",AT_NAME)
                 break
             if token.kind == "COMMA":
                 token=next(tokenizer)
         token=next(tokenizer) # skip closing parenthesis
     else: 
-        errorJsrnc("parseFacets","open parenthesis expected at the start of a facet",["IDENT","STR"])
+        errorJsrnc("parseFacets","open parenthesis expected at the start of a facet",AT_NAME)
     #todo: check that min{inum|Length|Items|Properties} are <= than the corresponding max...
     if traceParse:print (">>parseFacets:"+str(facets))
     return facets
@@ -433,11 +445,18 @@ def parseFacets(theType):
 # a number indicating the number of errors found during parsing
 #
 def parseJsonRnc(jsonrncContent):
-    global token,tokenizer,lines
-    for line in jsonrncContent: # must read all input for dealing with stdin
-        lines.append(line)
-    # print lines
-    tokenizer = tokenizeRNC("".join(lines[1:]))
+    global token,tokenizer,text,schema,defs,refs,errorsInSchema
+    # start from fresh shared variables so that many schemas can be parsed by the same program
+    schema = {
+        "$schema":"http://json-schema.org/draft-07/schema#",
+        "definitions":{}
+        }
+    defs = schema["definitions"]
+    refs = set([])
+    errorsInSchema=0
+    # must read all input for dealing with stdin, it is kept in a single string
+    text = jsonrncContent.read() if hasattr(jsonrncContent,"read") else "".join(jsonrncContent)
+    tokenizer = tokenizeRNC(text)
     token = next(tokenizer)
     try:
         while token.kind!="EOF":
@@ -455,6 +474,8 @@ def parseJsonRnc(jsonrncContent):
 if __name__ == '__main__':
     parser=argparse.ArgumentParser(description="Parse a JSON-rnc schema from a file or from stdin if no file is given. When there is no error in the schema, produce a JSON Schema on stdout")
     parser.add_argument("--debug",help="Trace calls for debugging",action="store_true")
+    parser.add_argument("--explain",help="Instead of the JSON Schema, output the validation plan of the schema with estimated costs "+
+                        "in text or json format",choices=["text","json"])
     parser.add_argument("jsonrnc_file",help="name of the JSON-RNC file to parse",nargs='?')
     args=parser.parse_args()
     if args.debug : traceParse=True
@@ -469,6 +490,9 @@ if __name__ == '__main__':
             schema=parseJsonRnc(open(pythonSchemaFileName))
     if type(schema) is int:
         print (str(schema)+" errors found in schema in "+pythonSchemaFileName)
+    elif args.explain!=None:
+        from ExplainSchema import explainSchema,printExplanation
+        printExplanation(sys.stdout,explainSchema(schema),args.explain,pythonSchemaFileName)
     else:
         schema["title"]="Created from JSON-RNC: "+pythonSchemaFileName
         schema["description"]="Written: "+datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -0,0 +1,117 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Projection of a JSON schema on some paths of the records
+###  the schema is pruned so that only the selected subtrees of the records are validated (--only)
+###  or so that some subtrees are not validated (--skip)
+###  paths are lists of keys separated by slashes as for the -id of ValidateJsonRnc (e.g. "_id/$oid"),
+###  they go through arrays, alternatives and references to definitions
+########################################################################
+
+import ValidateJsonObject
+from ValidateJsonObject import deref
+
+## follow the references of a node of a schema until a type or a list of alternatives
+def resolve(node,root):
+    ValidateJsonObject.rootSchema=root
+    while "$ref" in node:
+        node=deref(node["$ref"].split("/"),root)
+    return node
+
+## tree of paths: each node is a dict {"all":True when a path ends there, "children":{key:node}, "matched":False}
+def pathTree(paths):
+    tree={"all":False,"children":{},"matched":False}
+    for path in paths:
+        node=tree
+        for key in path.split("/"):
+            node=node["children"].setdefault(key,{"all":False,"children":{},"matched":False})
+        node["all"]=True
+    return tree
+
+## paths of the tree whose last key was not found in the schema
+def unmatchedPaths(tree,prefix=""):
+    paths=[]
+    for (key,node) in tree["children"].items():
+        path=prefix+key
+        if not(node["matched"]):
+            paths.append(path)
+        else:
+            paths.extend(unmatchedPaths(node,path+"/"))
+    return paths
+
+###
+#  keep only the parts of the node selected by the tree; the other fields of objects are not validated
+#  (additionalProperties is true) and only the selected ones are required when they were
+def keepNode(node,tree,root):
+    if tree["all"]:
+        return node
+    node=resolve(node,root)
+    if "oneOf" in node:
+        return {"oneOf":[keepNode(alt,tree,root) for alt in node["oneOf"]]}
+    theType=node.get("type")
+    if theType=="array" and "items" in node:
+        res=dict(node)
+        res["items"]=keepNode(node["items"],tree,root)
+        return res
+    if theType=="object":
+        props=node.get("properties",{})
+        addProps=node.get("additionalProperties")
+        res={key:value for (key,value) in node.items() if key not in ["properties","required","additionalProperties"]}
+        res["properties"]={}
+        for (key,subTree) in tree["children"].items():
+            if key in props:
+                res["properties"][key]=keepNode(props[key],subTree,root)
+            elif type(addProps) is dict: # object with arbitrary keys
+                res["properties"][key]=keepNode(addProps,subTree,root)
+            else:
+                continue
+            subTree["matched"]=True
+        res["required"]=[key for key in node.get("required",[]) if key in res["properties"]]
+        res["additionalProperties"]=True
+        return res
+    return node # the path goes deeper than the schema
+
+###
+#  replace the part of the node at the path (list of keys) by the empty schema, which accepts any value,
+#  and make it optional; the nodes along the path are copied
+#  returns (new node, True if the path was found)
+def skipNode(node,path,root):
+    node=resolve(node,root)
+    if "oneOf" in node:
+        alts=[skipNode(alt,path,root) for alt in node["oneOf"]]
+        return ({"oneOf":[alt for (alt,found) in alts]},any([found for (alt,found) in alts]))
+    theType=node.get("type")
+    if theType=="array" and "items" in node:
+        (items,found)=skipNode(node["items"],path,root)
+        res=dict(node)
+        res["items"]=items
+        return (res,found)
+    if theType=="object" and path[0] in node.get("properties",{}):
+        res=dict(node)
+        res["properties"]=dict(node["properties"])
+        if len(path)==1:
+            res["properties"][path[0]]={}
+            res["required"]=[key for key in node.get("required",[]) if key!=path[0]]
+            return (res,True)
+        (res["properties"][path[0]],found)=skipNode(node["properties"][path[0]],path[1:],root)
+        return (res,found)
+    return (node,False)
+
+###
+#  project a schema on the paths of only (all of the schema when empty) without the paths of skip
+#  returns (projected schema, list of the paths not found in the schema)
+def projectSchema(schema,only,skip):
+    unmatched=[]
+    res=schema
+    if len(only)>0:
+        tree=pathTree(only)
+        res=keepNode(schema,tree,schema)
+        unmatched.extend(unmatchedPaths(tree))
+    for path in skip:
+        (res,found)=skipNode(res,path.split("/"),schema)
+        if not(found): unmatched.append(path)
+    if res is not schema: # keep the definitions used by the selected subtrees
+        res=dict(res)
+        res["$schema"]=schema["$schema"]
+        res["definitions"]=schema.get("definitions",{})
+    return (res,unmatched)
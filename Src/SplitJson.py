@@ -5,7 +5,7 @@
 ###  Guy Lapalme (lapalme@iro.umontreal.ca) March 2015
 ########################################################################
 
-import re,argparse,sys
+import re,argparse,sys,json
 
 traceSplitter=False
 
@@ -43,6 +43,103 @@ def jsonSplitter(input):
             yield res
             res=""
 
+## generator that yields the successive JSON values read from a text stream
+#  values can span many lines and many values can appear on the same line.
+#  The stream is read by chunks and a value is decoded when it is complete; when it is not,
+#  a chunk at least as long as the pending text is added, so that the decoding time stays linear
+def jsonValues(stream,chunkSize=1<<16):
+    decoder=json.JSONDecoder()
+    blanks=re.compile(r'\s*')
+    buf=""
+    pos=0
+    eof=False
+    while True:
+        pos=blanks.match(buf,pos).end()
+        if pos==len(buf): # pending text is empty
+            if eof: return
+            buf=stream.read(chunkSize)
+            pos=0
+            eof=len(buf)==0
+            continue
+        try:
+            (value,end)=decoder.raw_decode(buf,pos)
+            if end<len(buf) or eof: # a number at the end of the text could be incomplete
+                yield value
+                pos=end
+                continue
+        except json.JSONDecodeError:
+            if eof: raise
+        more=stream.read(max(chunkSize,len(buf)-pos))
+        eof=len(more)==0
+        buf=buf[pos:]+more
+        pos=0
+
+## generator over the content of the JSON array or object that makes up a text stream
+#  first yields the kind of the container ("array" or "object"),
+#  then a pair (index,value) for each element of an array or (key,value) for each property of an object
+#  Values are decoded one at a time with decoder so that only the current one is kept in memory; 
+#  the text is read by chunks as in jsonValues
+def jsonContainerItems(stream,decoder=json.JSONDecoder(),chunkSize=1<<16):
+    blanks=re.compile(r'\s*')
+    buf=""
+    pos=0
+    eof=False
+    def need(n): # read until at least n characters are pending (or end of file)
+        nonlocal buf,pos,eof
+        while len(buf)-pos<n and not eof:
+            more=stream.read(max(chunkSize,len(buf)-pos))
+            eof=len(more)==0
+            buf=buf[pos:]+more
+            pos=0
+    def nextChar(): # skip blanks and return the next character ("" at the end of file)
+        nonlocal pos
+        while True:
+            pos=blanks.match(buf,pos).end()
+            if pos<len(buf) or eof:
+                return buf[pos:pos+1]
+            need(1)
+    def expect(chars,what):
+        nonlocal pos
+        c=nextChar()
+        if c=="" or c not in chars:
+            raise json.JSONDecodeError("Expecting "+what,buf,pos)
+        pos+=1
+        return c
+    def value():
+        nonlocal pos
+        nextChar()
+        while True:
+            try:
+                (val,end)=decoder.raw_decode(buf,pos)
+                if end<len(buf) or eof: # a number at the end of the text could be incomplete
+                    pos=end
+                    return val
+            except json.JSONDecodeError:
+                if eof: raise
+            need(len(buf)-pos+1)
+    opening=expect("[{","'[' or '{' at the start of the container")
+    kind="array" if opening=="[" else "object"
+    yield kind
+    closing="]" if kind=="array" else "}"
+    no=0
+    if nextChar()==closing:
+        pos+=1
+    else:
+        while True:
+            if kind=="array":
+                yield (no,value())
+            else:
+                if nextChar()!='"':
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes",buf,pos)
+                key=value()
+                expect(":","':' delimiter")
+                yield (key,value())
+            no+=1
+            if expect(","+closing,"',' delimiter")==closing:
+                break
+    if nextChar()!="":
+        raise json.JSONDecodeError("Extra data",buf,pos)
+
 if __name__ == '__main__':
     parser=argparse.ArgumentParser(description="Split stdin into single line JSON objects")
     parser.add_argument("--debug",help="Trace calls for debugging",action="store_true")
@@ -0,0 +1,227 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Validation of batches of records column by column for flat schemas
+###  the records of a batch are decoded, the values of each field of the schema are gathered in a column
+###  whose types and facets are checked at once (with NumPy when it is installed); the records for which
+###  a check fails are then validated one at a time by ValidateJsonObject for their messages,
+###  so that the messages are the same as with the object engine.
+###  A schema is flat when the records are objects whose fields are simple types or flat objects
+###  (no alternatives, arrays nor objects with arbitrary keys)
+########################################################################
+
+import re
+from operator import itemgetter
+from itertools import compress,repeat
+try:
+    import numpy
+except ImportError: # the columns are then checked with Python lists
+    numpy=None
+
+SIMPLE_TYPES=frozenset(["integer","number","boolean","string","null"])
+
+###
+#  plan of the checks of the columns for a node of an optimized schema (see OptimizeSchema):
+#  {"kind":"object","fields":{key:plan},"required":frozenset,"open":True when the other fields are not validated},
+#  {"kind":simple type,"node":node} or {"kind":"any"}, with the references followed to reach the node ("refs")
+#  patterns: False when the patterns cannot be checked in the columns (e.g. they must be checked within
+#            the time limit of a record), a node with a pattern is then not flat
+#  refs: references followed since the node of the parent plan
+#  returns None when the node is not flat (or recursive)
+def columnPlan(node,patterns=True,refs=()):
+    if "$memo" in node: # memoized definition
+        node=node["schema"]
+    if "$ref" in node and "oneOf" not in node and "type" not in node: # reference linked by OptimizeSchema
+        if "schema" not in node:
+            return None
+        return columnPlan(node["schema"],patterns,refs+(node,))
+    if "oneOf" in node:
+        return None
+    theType=node.get("type")
+    if theType in SIMPLE_TYPES:
+        if "pattern" in node and theType=="string" and not(patterns):
+            return None
+        return {"kind":theType,"node":node,"refs":refs,"pending":len(refs)>0}
+    if theType=="object":
+        if "minProperties" in node or "maxProperties" in node:
+            return None
+        if "additionalProperties" in node and type(node["additionalProperties"]) is not bool: # arbitrary keys
+            return None
+        if "properties" not in node: # any object
+            return {"kind":"object","fields":{},"required":frozenset(),"open":True,"refs":refs,"pending":len(refs)>0}
+        if "required" not in node or not(set(node["required"])<=node["properties"].keys()):
+            return None
+        if id(node) in planning: # recursive definition
+            return None
+        planning.add(id(node))
+        fields={}
+        for (key,prop) in node["properties"].items():
+            fields[key]=columnPlan(prop,patterns)
+            if fields[key]==None:
+                break
+        planning.discard(id(node))
+        if None in fields.values():
+            return None
+        return {"kind":"object","fields":fields,"required":frozenset(node["required"]),
+                "open":node.get("additionalProperties") is True,"refs":refs,
+                "pending":len(refs)>0 or any(field["pending"] for field in fields.values())}
+    if len(node)==0: # e.g. a skipped subtree
+        return {"kind":"any","refs":refs,"pending":len(refs)>0}
+    return None
+
+planning=set() # ids of the object nodes whose plan is being built
+
+###
+#  traverse the references of a plan for a value whose checks did not fail, as its validation by
+#  ValidateJsonObject would have done, so that the paths of the next messages are the same
+#  (refs: references traversed by the previous records, see ValidateJsonObject.RefTraversal);
+#  a plan is no longer pending once all its references are traversed
+def traverseRefs(plan,value,refs):
+    if not(plan["pending"]):
+        return
+    for ref in plan["refs"]:
+        refs.follow(ref)
+    if plan["kind"]=="object":
+        for (key,field) in plan["fields"].items():
+            if key in value:
+                traverseRefs(field,value[key],refs)
+    plan["pending"]=not(all(id(ref) in refs.traversed for ref in plan["refs"])) or (
+        plan["kind"]=="object" and any(field["pending"] for field in plan["fields"].values()))
+
+## plan for the records, None when they cannot be checked by columns
+def recordPlan(schema,patterns=True):
+    plan=columnPlan(schema,patterns)
+    return plan if plan!=None and plan["kind"]=="object" else None
+
+###
+#  check the values of a column (rows are their numbers in the batch) according to a plan,
+#  adding to suspects the rows for which a check fails
+def checkColumn(plan,rows,values,suspects):
+    kind=plan["kind"]
+    if kind=="any" or len(values)==0:
+        return
+    if kind!="object":
+        return checkSimple(plan["node"],rows,values,suspects)
+    (fields,required)=(plan["fields"],plan["required"])
+    known=None if plan["open"] else fields.keys() # keys allowed in the objects
+    good=[i for (i,value) in enumerate(values)
+            if type(value) is dict and value.keys()>=required and (known==None or value.keys()<=known)]
+    if len(good)<len(values): # the other fields of the rows in error are not checked
+        suspects.update(set(rows)-{rows[i] for i in good})
+        (rows,values)=([rows[i] for i in good],[values[i] for i in good])
+    for (key,field) in fields.items(): # the column of each field
+        if key in required:
+            checkColumn(field,rows,list(map(itemgetter(key),values)),suspects)
+        else:
+            present=list(map(dict.__contains__,values,repeat(key)))
+            if any(present):
+                checkColumn(field,list(compress(rows,present)),list(map(itemgetter(key),compress(values,present))),suspects)
+
+## types of the values of each simple type, as in ValidateJsonObject.validateSimpleType (number accepts booleans)
+TYPES={"string":{str},"integer":{int},"number":{int,float,bool},"boolean":{bool},"null":{type(None)}}
+
+## positions of the values of a column that are not of a simple type
+def typeErrors(theType,values):
+    if set(map(type,values))<=TYPES[theType]:
+        return []
+    if theType=="string":
+        return [i for (i,v) in enumerate(values) if not isinstance(v,str)]
+    if theType=="number":
+        return [i for (i,v) in enumerate(values) if not isinstance(v,(int,float))]
+    return [i for (i,v) in enumerate(values) if type(v) not in TYPES[theType]]
+
+###
+#  positions of the values of a numeric column outside of the bounds of the facets of node, as in
+#  ValidateJsonObject.validateFacets; with NumPy, the values are compared as floats so a value equal to a bound
+#  (as a float) is reported as an error and checked again one at a time; otherwise the values are compared
+#  one at a time only when the smallest or the largest one is out of bounds (or NaN)
+def rangeErrors(node,values):
+    bounds=[(facet,node[facet]) for facet in ["minimum","exclusiveMinimum","maximum","exclusiveMaximum"] if facet in node]
+    if len(bounds)==0:
+        return []
+    if numpy!=None:
+        try:
+            column=numpy.array(values,dtype=numpy.float64)
+            ok=numpy.ones(len(values),dtype=bool)
+            for (facet,bound) in bounds:
+                ok&=column>bound if facet in ["minimum","exclusiveMinimum"] else column<bound
+            return numpy.flatnonzero(~ok).tolist()
+        except OverflowError: # integers too big for a float
+            pass
+    (low,high)=(min(values),max(values))
+    errors=set()
+    for (facet,bound) in bounds:
+        if facet=="minimum" and not(low>=bound):
+            errors.update([i for (i,v) in enumerate(values) if v<bound])
+        elif facet=="exclusiveMinimum" and not(low>bound):
+            errors.update([i for (i,v) in enumerate(values) if v<=bound])
+        elif facet=="maximum" and not(high<=bound):
+            errors.update([i for (i,v) in enumerate(values) if v>bound])
+        elif facet=="exclusiveMaximum" and not(high<bound):
+            errors.update([i for (i,v) in enumerate(values) if v>=bound])
+    return list(errors)
+
+## positions of the values of a string column whose length or pattern do not match the facets of node
+def stringErrors(node,values):
+    errors=[]
+    if "minLength" in node or "maxLength" in node:
+        (low,high)=(node.get("minLength",0),node.get("maxLength"))
+        if numpy!=None:
+            lengths=numpy.fromiter(map(len,values),dtype=numpy.int64,count=len(values))
+            bad=lengths<low
+            if high!=None: bad|=lengths>high
+            errors.extend(numpy.flatnonzero(bad).tolist())
+        else:
+            lengths=list(map(len,values))
+            if min(lengths)<low or (high!=None and max(lengths)>high):
+                errors.extend([i for (i,n) in enumerate(lengths) if n<low or (high!=None and n>high)])
+    if "pattern" in node:
+        match=re.compile("^"+node["pattern"]+"$").match # anchored as in ValidateJsonObject.validateFacets
+        if not all(map(match,values)):
+            errors.extend([i for (i,v) in enumerate(values) if not match(v)])
+    return errors
+
+def checkSimple(node,rows,values,suspects):
+    theType=node["type"]
+    errors=typeErrors(theType,values)
+    if len(errors)>0: # the facets are checked on the values of the right type
+        suspects.update([rows[i] for i in errors])
+        bad=set(errors)
+        rows=[row for (i,row) in enumerate(rows) if i not in bad]
+        values=[value for (i,value) in enumerate(values) if i not in bad]
+        if len(values)==0:
+            return
+    if theType in ["integer","number"]:
+        errors=rangeErrors(node,values)
+    elif theType=="string":
+        errors=stringErrors(node,values)
+    else:
+        errors=[]
+    suspects.update([rows[i] for i in errors])
+
+###
+#  decode and check the records of stream by batches of size records
+#  decode: function decoding the text of a record, whose exceptions are kept for the record
+#  yields (text of the record, its decoded value or the exception raised by decode, True when no check failed)
+def checkBatches(stream,plan,size,decode):
+    batch=[]
+    for text in stream:
+        batch.append(text)
+        if len(batch)==size:
+            yield from checkBatch(batch,plan,decode)
+            batch=[]
+    if len(batch)>0:
+        yield from checkBatch(batch,plan,decode)
+
+def checkBatch(batch,plan,decode):
+    decoded=[]
+    for text in batch:
+        try:
+            decoded.append(decode(text))
+        except (ValueError,KeyError) as err:
+            decoded.append(err)
+    rows=[row for (row,value) in enumerate(decoded) if not isinstance(value,Exception)]
+    suspects=set()
+    checkColumn(plan,rows,[decoded[row] for row in rows],suspects)
+    for (row,text) in enumerate(batch):
+        yield (text,decoded[row],row not in suspects)
@@ -6,15 +6,75 @@
 ##   revision for adding statistics on error messages, May 2015
 ########################################################################
 
-import re
+import re,sys,heapq,time,collections,shutil
+from json.encoder import encode_basestring as quoteJson
+try:
+    import re._parser as sre_parse # Python 3.11+
+except ImportError:
+    import sre_parse
 
 traceValidate=False
 
 # global schema
 rootSchema=None
 
+## references of an optimized schema (see OptimizeSchema) traversed while validating the records of a file:
+#  as when the references were replaced by their definition during the validation, the path of a value shows
+#  a reference (e.g. [0]/(#/definitions/person)/postalCode) only the first time it is traversed.
+#  Each file has its own (each record when none is given to checkObject), so that the messages of a file
+#  do not depend on the files validated before it by the same process
+class RefTraversal:
+    def __init__(self):
+        self.traversed=set() # ids of the references traversed
+        self.new=[]          # ids of the references traversed for the first time since the last call of forget
+        self.followed=None   # ids of the references followed while they are recorded (see record), None otherwise
+
+    ## True the first time a reference is traversed
+    def follow(self,ref):
+        key=id(ref)
+        if self.followed!=None:
+            self.followed.append(key)
+        if key in self.traversed:
+            return False
+        self.traversed.add(key)
+        self.new.append(key)
+        return True
+
+    ## forget the references traversed for the first time since the last call (e.g. for a record rejected by ValidateJsonText)
+    def forget(self):
+        self.traversed.difference_update(self.new)
+        self.new.clear()
+
+    ## start recording the references followed (e.g. for caching a validation), returns the position of the next one
+    def record(self):
+        if self.followed==None:
+            self.followed=[]
+        return len(self.followed)
+
+    ## set of the references followed since position start, the recording stops when it was started there
+    def recorded(self,start):
+        found=frozenset(self.followed[start:])
+        if start==0:
+            self.followed=None
+        return found
+
+    ## the references followed by a validation whose cached result is used instead
+    def replay(self,found):
+        if self.followed!=None:
+            self.followed.extend(found)
+
+## path of a value: () (or []) for the root, (path of its container, key or index) otherwise,
+#  so that it is built in constant time and only turned into a string for an error message
+def pathString(sels):
+    keys=[]
+    while sels:
+        (sels,key)=sels
+        keys.append(key if type(key) is str else "["+str(key)+"]")
+    keys.reverse()
+    return "/".join(keys)
+
 def errorValidate(sels,mess,infos):
-    return "%s\t%s\t%s\n"%("/".join(sels),mess,infos)
+    return "%s\t%s\t%s\n"%(pathString(sels),mess,infos)
 def errorSchema(sels,mess,infos):
     return "! Error in schema !\t"+errorValidate(sels,mess,infos)
     
@@ -42,17 +102,30 @@ def deref(selects,schema):
     else:
         raise NameError("could not find:"+field) 
 
+## schema of a reference: the definition linked by OptimizeSchema or, in a schema that is not optimized,
+#  the reference merged with its definition (without changing the schema); raises NameError when it cannot be found
+def refSchema(ref):
+    if "schema" in ref:
+        return ref["schema"]
+    if "error" in ref:
+        raise NameError(ref["error"])
+    merged={key:value for (key,value) in ref.items() if key!="$ref"}
+    merged.update(deref(ref["$ref"].split("/"),rootSchema))
+    return merged
+
 ### 
-#  validate object o according to a schema keeping track of selectors (sels)
-#  that are used to identify errors 
+#  validate object o according to a schema keeping track of the path of o (sels, see pathString)
+#  that is used to identify errors, refs being the references already traversed (see RefTraversal)
 #  return "" if no error otherwise returns an error message
-def validate(sels,schema,parent,o):
+def validate(sels,schema,parent,o,refs):
     global traceValidate
-    if traceValidate: print ("$$validate:%s:%s:%s"%("/".join(sels),showVal(schema),showVal(o)))
+    if traceValidate: print ("$$validate:%s:%s:%s"%(pathString(sels),showVal(schema),showVal(o)))
+    if "$memo" in schema:
+        return validateMemo(sels,schema,parent,o,refs)
     if "oneOf" in schema:
         allMess=[]
         for alt in schema["oneOf"]:
-            mess=validate(sels,alt,schema,o)
+            mess=validate(sels,alt,schema,o,refs)
             if traceValidate: print ("$$$"+showVal(alt)+"=>"+mess)
             if mess=="":
                 return ""
@@ -80,13 +153,11 @@ def validate(sels,schema,parent,o):
                 if "additionalProperties" in schema and type(schema["additionalProperties"]) is not bool:
                     # validate only values, not field names
                     for field in iter(o):
-                        newSels=list(sels)
-                        newSels.append(field)
-                        valid+=validate(newSels,schema["additionalProperties"],parent,o[field])
+                        valid+=validate((sels,field),schema["additionalProperties"],parent,o[field],refs)
                     return valid
                 elif 'properties' in schema:
                     if "required" in schema:
-                        return validateProperties(sels,schema['properties'],schema['required'],schema,o)
+                        return validateProperties(sels,schema['properties'],schema['required'],schema,o,refs)
                     else:
                         return errorSchema(sels,"'required' field not in schema","")
                 else:
@@ -98,17 +169,16 @@ def validate(sels,schema,parent,o):
                 if 'items' in schema: 
                     schemaItems=schema['items']
                     valid=""
-                    newSels=list(sels)
                     no=0
                     for elem in o: #check each element of the array
-                        valid+=validate(newSels+["["+str(no)+"]"],schemaItems,[],elem)
+                        valid+=validate((sels,no),schemaItems,[],elem,refs)
                         no+=1
                     if "minItems" in schema:
                         if no<schema["minItems"]:
-                            valid+=errorValidate(newSels,"array length less than "+str(schema["minItems"]),showVal(o))
+                            valid+=errorValidate(sels,"array length less than "+str(schema["minItems"]),showVal(o))
                     if "maxItems" in schema:
                         if no>schema["maxItems"]:
-                            valid+=errorValidate(newSels,"array length greater than "+str(schema["maxItems"]),showVal(o))
+                            valid+=errorValidate(sels,"array length greater than "+str(schema["maxItems"]),showVal(o))
                     return valid
                 else:
                     return "" # no validation when no item is defined...
@@ -116,39 +186,150 @@ def validate(sels,schema,parent,o):
                 return errorValidate(sels,"array expected:",showVal(o))
         else:
             return errorSchema(sels,"unexpected type:",str(theType))
-    if "$ref" in schema: # hack replace in the schema the type reference by its definition 
+    if "$ref" in schema: # reference linked to its definition by OptimizeSchema
+        typeref=schema["$ref"]
         try:
-            typeref=schema["$ref"]
-            newType=deref(typeref.split("/"),parent)
-            schema.update(newType)
-            del schema["$ref"]
-            return validate(sels+["("+typeref+")"],schema,parent,o)
+            linked=refSchema(schema)
         except NameError as err: # we could not dereference...
-            return str(err)+" in "+typeref
+            return errorSchema(sels,str(err)+" in "+typeref,"")
+        return validate((sels,"("+typeref+")") if refs.follow(schema) else sels,linked,parent,o,refs)
+    if len(schema)==0: # empty schema (e.g. for a skipped subtree, see ProjectSchema) accepts any value
+        return ""
     return errorSchema(sels,"Schema without type, oneOf nor $ref:",showVal(schema))
 
-def validateProperties(sels,props,required,parent,obj):
+### memoization of the validation of repeated values 
+##  bounded cache of the least recently used entries, with counts for estimating its benefit
+class LruCache:
+    def __init__(self,size,name):
+        self.size=size
+        self.name=name
+        self.entries=collections.OrderedDict()
+        self.hits=0
+        self.misses=0
+        self.workTime=0.0   # time taken to compute the entries
+        self.lookupTime=0.0 # time taken to build keys and look them up
+
+    ## entry of a key, None when there is none or when usable(entry) is False
+    def get(self,key,usable=None):
+        entry=self.entries.get(key)
+        if entry is not None and usable!=None and not(usable(entry)):
+            entry=None
+        if entry is None:
+            self.misses+=1
+        else:
+            self.hits+=1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self,key,value):
+        self.entries[key]=value
+        if len(self.entries)>self.size:
+            self.entries.popitem(last=False)
+
+    ## hit rate and speedup of the cached work, estimated by assuming that each hit would have taken the average time of a miss
+    def summary(self):
+        lookups=self.hits+self.misses
+        if lookups==0 or self.misses==0:
+            return self.name+": "+showNum(lookups)+" lookups"
+        cost=self.workTime+self.lookupTime
+        speedup=self.workTime*lookups/self.misses/cost if cost>0 else 1.0
+        return "%s: %s hits for %s lookups (%.1f%%), estimated speedup of the cached work %.2fx"%(
+                self.name,showNum(self.hits),showNum(lookups),100*self.hits/lookups,speedup)
+
+## key of a JSON value for caching: equal only for values with the same structure, the same order of fields 
+#  and the same types of scalars (so that 1, 1.0 and true are distinguished) 
+def frozenKey(o):
+    t=type(o)
+    if t is dict:
+        return (dict,tuple([(field,frozenKey(value)) for (field,value) in o.items()]))
+    if t is list:
+        return (list,tuple([frozenKey(elem) for elem in o]))
+    return (t,o)
+
+MARK="\x00memo\x00" # path of a memoized value in the cached messages, replaced by its path when they are used
+memoCaches=[]       # caches of the memoized definitions for their summaries
+
+## replace the references to the definitions in names by nodes {"$memo":cache,"schema":reference} 
+#  so that the validation of values matching a definition is cached (size is the number of values kept)
+#  returns the names that are not definitions of the schema
+def memoizeRefs(schema,names,size):
+    caches={name:LruCache(size,name) for name in names if name in schema.get("definitions",{})}
+    def wrapRefs(node):
+        if type(node) is list:
+            for (i,elem) in enumerate(node):
+                node[i]=wrapRefs(elem)
+        elif type(node) is dict:
+            if "$ref" in node and node["$ref"].startswith("#/definitions/") and node["$ref"][14:] in caches:
+                return {"$memo":caches[node["$ref"][14:]],"schema":node}
+            for (key,value) in node.items():
+                if type(value) in [dict,list] and key!="$memo":
+                    node[key]=wrapRefs(value)
+        return node
+    for (key,value) in schema.items(): # the root itself is not memoized
+        if type(value) in [dict,list]:
+            schema[key]=wrapRefs(value)
+    memoCaches.extend(caches.values())
+    return [name for name in names if name not in caches]
+
+def validateMemo(sels,schema,parent,o,refs):
+    ref=schema["schema"]
+    if "schema" not in ref: # not linked by OptimizeSchema
+        return validate(sels,ref,parent,o,refs)
+    # the reference is traversed here so that the cached messages do not depend on the place of the value
+    if refs.follow(ref):
+        sels=(sels,"("+ref["$ref"]+")")
+    cache=schema["$memo"]
+    start=time.perf_counter()
+    key=(id(ref["schema"]),frozenKey(o))
+    # an entry is kept with the references followed for it and used only when they have all been traversed,
+    # so that the validation of the value would not show them in its paths (e.g. at the start of the next file)
+    entry=cache.get(key,lambda entry:entry[1]<=refs.traversed)
+    if entry==None:
+        workStart=time.perf_counter()
+        nbTraversed=len(refs.traversed)
+        position=refs.record()
+        mess=validate(((),MARK),ref["schema"],parent,o,refs)
+        followed=refs.recorded(position)
+        end=time.perf_counter()
+        cache.workTime+=end-workStart
+        cache.lookupTime+=workStart-start
+        if len(refs.traversed)==nbTraversed: # the paths of the messages do not show references traversed for the first time
+            cache.put(key,(mess,followed))
+    else:
+        cache.lookupTime+=time.perf_counter()-start
+        (mess,followed)=entry
+        refs.replay(followed)
+    if mess=="" or MARK not in mess: return mess
+    if not sels:
+        return mess.replace(MARK+"/","").replace(MARK,"")
+    return mess.replace(MARK,pathString(sels))
+
+def validateProperties(sels,props,required,parent,obj,refs):
     global traceValidate
     if traceValidate:print ("$$validateProperties:%s:%s:%s"%(showVal(props),str(required),showVal(obj)))
     valid=""
     if not(type(obj) is dict):
         return errorValidate(sels,"object expected:",showVal(obj))
+    if parent.get("additionalProperties") is True: # only the given properties are validated (see ProjectSchema)
+        for field in props:
+            if field in obj:
+                valid+=validate((sels,field),props[field],parent,obj[field],refs)
+            elif field in required:
+                valid+=errorValidate(sels,"missing required field:"+field,"")
+        return valid
     # validate required fields
     for field in required:
         if field in obj:
-            newSels=list(sels) # update selector list
-            newSels.append(field)
-            valid+=validate(newSels,props[field],parent,obj[field])
+            valid+=validate((sels,field),props[field],parent,obj[field],refs)
         else:
             valid+=errorValidate(sels,"missing required field:"+field,"")
     # validate the other fields of the object
     # validate if fields are present or not
+    # (required is a dict in an optimized schema, so that this is linear in the number of fields)
     for field in iter(obj):
         if field not in required: # required fields have already been validated
-            newSels=list(sels)    # update the selector list
-            newSels.append(field)
             if field in props:
-                valid+=validate(newSels,props[field],parent,obj[field])
+                valid+=validate((sels,field),props[field],parent,obj[field],refs)
             else:
                 valid+=errorValidate(sels,"unexpected field in object:"+field,"")
     return valid
@@ -217,6 +398,187 @@ def validateFacets(sels,schema,value):
             valid+=errorValidate(sels,"string expected:",str(value))
     return valid
 
+### detection of the patterns whose matching can take an exponential time (ReDoS) by backtracking
+REPEATS=[sre_parse.MAX_REPEAT,sre_parse.MIN_REPEAT] # possessive repeats and atomic groups do not backtrack
+
+## set of the first characters (code points) of the non-empty strings matched by a parsed regular expression
+#  (empty when it matches only the empty string) or None when there can be too many of them to be compared
+def firstChars(items):
+    chars=set()
+    for (op,av) in items:
+        if op is sre_parse.AT: # zero-width assertion
+            continue
+        if op is sre_parse.LITERAL:
+            return chars|{av}
+        if op is sre_parse.IN:
+            for (inOp,inAv) in av:
+                if inOp is sre_parse.LITERAL:
+                    chars.add(inAv)
+                elif inOp is sre_parse.RANGE and inAv[1]-inAv[0]<256:
+                    chars.update(range(inAv[0],inAv[1]+1))
+                else:
+                    return None # negation or category
+            return chars
+        if op is sre_parse.SUBPATTERN:
+            c=firstChars(av[-1])
+        elif op is sre_parse.BRANCH:
+            c=set()
+            for alt in av[1]:
+                altChars=firstChars(alt)
+                if altChars==None: return None
+                c.update(altChars)
+        elif op in REPEATS:
+            c=firstChars(av[2])
+        else:
+            return None
+        if c==None: return None
+        chars.update(c)
+        if not matchesEmpty([(op,av)]): # the next item can start only the strings matched when this one is empty
+            return chars
+    return chars
+
+## classes of all the characters that can be matched by a parsed regular expression: 
+#  list of (True,set of characters) or (False,set of characters not matched), None when they cannot be compared
+def allChars(items):
+    classes=[]
+    for (op,av) in items:
+        if op is sre_parse.AT:
+            continue
+        if op is sre_parse.IN and len(av)>0 and av[0][0] is sre_parse.NEGATE:
+            chars=firstChars([(op,av[1:])])
+            c=None if chars==None else [(False,chars)]
+        elif op is sre_parse.LITERAL or op is sre_parse.IN:
+            chars=firstChars([(op,av)])
+            c=None if chars==None else [(True,chars)]
+        elif op is sre_parse.NOT_LITERAL:
+            c=[(False,{av})]
+        elif op is sre_parse.SUBPATTERN:
+            c=allChars(av[-1])
+        elif op is sre_parse.BRANCH:
+            c=[]
+            for alt in av[1]:
+                altClasses=allChars(alt)
+                if altClasses==None: return None
+                c.extend(altClasses)
+        elif op in REPEATS:
+            c=allChars(av[2])
+        else:
+            return None
+        if c==None: return None
+        classes.extend(c)
+    return classes
+
+## parsed regular expressions repeated without bound (not possessively) within a parsed regular expression
+def unboundedRepeats(items):
+    found=[]
+    for (op,av) in items:
+        if op in REPEATS:
+            if av[1]==sre_parse.MAXREPEAT:
+                found.append(av[2])
+            found.extend(unboundedRepeats(av[2]))
+        elif op is sre_parse.SUBPATTERN:
+            found.extend(unboundedRepeats(av[-1]))
+        elif op is sre_parse.BRANCH:
+            for alt in av[1]:
+                found.extend(unboundedRepeats(alt))
+    return found
+
+## check if a parsed regular expression can match the empty string
+def matchesEmpty(items):
+    for (op,av) in items:
+        if op is sre_parse.AT:
+            continue
+        if op is sre_parse.SUBPATTERN:
+            if not matchesEmpty(av[-1]): return False
+        elif op is sre_parse.BRANCH:
+            if not any(matchesEmpty(alt) for alt in av[1]): return False
+        elif op in REPEATS:
+            if av[0]>0 and not matchesEmpty(av[2]): return False
+        else:
+            return False
+    return True
+
+## check if the characters matched by the repetitions of the body of a repetition can be shared 
+#  by successive iterations, i.e. if the body has no mandatory character that cannot be matched by them
+#  (e.g. ( [A-Z][a-z]+)* is safe because of the space)
+def ambiguousIterations(body,inner):
+    innerClasses=[]
+    for repeated in inner:
+        classes=allChars(repeated)
+        if classes==None: return True
+        innerClasses.extend(classes)
+    for (op,av) in body:
+        if op is sre_parse.LITERAL or op is sre_parse.IN:
+            chars=firstChars([(op,av)])
+            if chars!=None and len(chars)>0 and \
+               all(chars.isdisjoint(c) if matched else chars<=c for (matched,c) in innerClasses):
+                return False
+    return True
+
+## list of the reasons for which a pattern can take an exponential time to match a string 
+#  (nested repetitions or repeated alternatives that can match the same characters)
+def patternRisks(pattern):
+    try:
+        parsed=sre_parse.parse(pattern)
+    except re.error as err:
+        return ["invalid regular expression: "+str(err)]
+    risks=[]
+    ## inRepeat: within the body of an unbounded repetition, emptyBefore: the items before these ones in the body can be empty,
+    #  after: first characters of what can follow these items in the same iteration or the next one (None if not comparable),
+    #  emptyAfter: the items after these ones in the body can be empty
+    def walk(items,inRepeat,emptyBefore,after,emptyAfter):
+        for (i,(op,av)) in enumerate(items):
+            rest=items[i+1:]
+            preceded=emptyBefore and matchesEmpty(items[:i])
+            followed=firstChars(rest)
+            emptyRest=matchesEmpty(rest)
+            if emptyRest:
+                followed=None if followed==None or after==None else followed|after
+            if op in REPEATS:
+                (low,high,sub)=av
+                body=sub[0][1][-1] if len(sub)==1 and sub[0][0] is sre_parse.SUBPATTERN else sub
+                inner=unboundedRepeats(body)
+                if high>1 and len(inner)>0 and ambiguousIterations(body,inner):
+                    risks.append("nested repetitions")
+                if high>1: # the end of an iteration can be followed by the start of the next one
+                    walk(sub,True,True,firstChars(sub),True)
+                else:
+                    walk(sub,inRepeat,preceded,followed,emptyRest and emptyAfter)
+            elif op is sre_parse.SUBPATTERN:
+                walk(av[-1],inRepeat,preceded,followed,emptyRest and emptyAfter)
+            elif op is sre_parse.BRANCH:
+                alts=av[1]
+                if inRepeat and len(alts)>1:
+                    # the common prefix of alternatives is factored out, e.g. (a|aa)+ is parsed as a(|a)+,
+                    # so that the alternatives are compared by the rest of them
+                    firsts=[firstChars(alt) for alt in alts]
+                    empties=[matchesEmpty(alt) for alt in alts]
+                    if None in firsts or len(set().union(*firsts))<sum(map(len,firsts)):
+                        risks.append("repeated alternatives that can start with the same character")
+                    elif any(empties) and not(preceded and emptyRest and emptyAfter): # empty iterations are not repeated
+                        others=set().union(*[chars for (chars,empty) in zip(firsts,empties) if not empty])
+                        if empties.count(True)>1 or followed==None or not others.isdisjoint(followed):
+                            risks.append("repeated alternatives, one of which can be followed by the rest of another")
+                for alt in alts:
+                    walk(alt,inRepeat,preceded,followed,emptyRest and emptyAfter)
+    walk(parsed.data,False,True,set(),True)
+    return list(dict.fromkeys(risks))
+
+## list of (path,pattern,risks) for the risky patterns of a schema
+def riskyPatterns(schema,path=""):
+    found=[]
+    if type(schema) is dict:
+        if type(schema.get("pattern")) is str:
+            risks=patternRisks(schema["pattern"])
+            if len(risks)>0:
+                found.append((path,schema["pattern"],risks))
+        for (key,value) in schema.items():
+            found.extend(riskyPatterns(value,path+"/"+key))
+    elif type(schema) is list:
+        for (i,elem) in enumerate(schema):
+            found.extend(riskyPatterns(elem,path+"/"+str(i)))
+    return found
+
 ### show n ,an integer, with a space as a blank separator right aligned 
 ##              in a field of 'width' chars (expanded if necessary)
 ##  I have never managed to understand how to use the locale aware thousand separator       
@@ -229,39 +591,212 @@ def showNum(n,width=0):
     s+=res
     return (width-len(s))*" "+s
 
+### output of the messages about the records
+#   outputFormat: "text" (default) for human readers, 
+#                 "jsonl" or "tsv" for a row for each error: record id, byte offset, path, message, value
+#   messages are accumulated and written in large chunks by flushOutput()
+outputFormat="text"
+recordFile=None # name of the file of the records, output in the rows of structured formats when validating many files
+outputBufferSize=1<<20 # number of characters accumulated before writing them
+outputBuffer=[]
+outputBufferLength=0
+
+def writeOutput(s):
+    global outputBufferLength
+    outputBuffer.append(s)
+    outputBufferLength+=len(s)
+    if outputBufferLength>=outputBufferSize:
+        flushOutput()
+
+def flushOutput():
+    global outputBufferLength
+    sys.stdout.write("".join(outputBuffer))
+    sys.stdout.flush()
+    outputBuffer.clear()
+    outputBufferLength=0
+
+## file for the summaries and statistics, kept apart from the rows of structured formats
+def summaryOutput():
+    return sys.stdout if outputFormat=="text" else sys.stderr
+
+## split validation messages into a list of (path,message,value)
+def errorRows(mess):
+    rows=[]
+    for line in mess.split("\n")[0:-1]:
+        if line[0:2]==" -": line=line[2:] # error within an alternative
+        schemaError=line.startswith("! Error in schema !\t")
+        if schemaError: line=line[20:]
+        fields=line.split("\t",2)
+        if len(fields)<3: fields=["",line,""]
+        if schemaError: fields[1]="! Error in schema ! "+fields[1]
+        rows.append(fields)
+    return rows
+
+def escapeTsv(s):
+    if "\t" in s or "\n" in s or "\\" in s:
+        return s.replace("\\","\\\\").replace("\t","\\t").replace("\n","\\n")
+    return s
+
+## output a message about a record: text is output as is in the "text" format
+#  otherwise mess (in the format produced by errorValidate) is output as rows
+def logMessage(text,recordId,offset,mess):
+    if outputFormat=="text":
+        writeOutput(text)
+    elif outputFormat=="jsonl":
+        prefix=('{' if recordFile==None else '{"file":'+quoteJson(recordFile)+',')+'"record":'+quoteJson(str(recordId))+',"offset":'+("null" if offset==None else str(offset))+',"path":'
+        writeOutput("".join([prefix+quoteJson(path)+',"message":'+quoteJson(message)+',"value":'+quoteJson(value)+"}\n"
+                             for (path,message,value) in errorRows(mess)]))
+    else:
+        prefix=("" if recordFile==None else escapeTsv(recordFile)+"\t")+escapeTsv(str(recordId))+"\t"+("" if offset==None else str(offset))+"\t"
+        writeOutput("".join([prefix+escapeTsv(path)+"\t"+escapeTsv(message)+"\t"+escapeTsv(value)+"\n"
+                             for (path,message,value) in errorRows(mess)]))
+
+### error statistics
+topSize=1000      # maximum number of error types counted in a table, 0 for no limit
+exactPaths=False  # keep the indices of arrays in the paths of error types instead of replacing them by [*]
+INDEX_RE=re.compile(r"\[\d+\]")
+
+## counts of the most frequent error types in bounded memory with the Space-Saving algorithm
+#  (Metwally, Agrawal, El Abbadi, 2005): when the table is full, the least frequent type is replaced by the new one,
+#  whose count is overestimated by at most the count of the replaced one (kept as its error);
+#  types occurring more than (number of errors)/size times are always in the table.
+#  The counts are exact when there are no more types than the size of the table
+class TopCounts:
+    def __init__(self,size=None):
+        self.size=topSize if size==None else size
+        self.counts={}
+        self.errors={}
+        self.heap=[] # (count,type), possibly outdated, for finding the least frequent type
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self,key,nb=1,error=0):
+        counts=self.counts
+        if key in counts:
+            counts[key]+=nb
+            self.errors[key]+=error
+        else:
+            if self.size>0 and len(counts)>=self.size:
+                (least,leastKey)=self.popLeast()
+                del counts[leastKey]
+                del self.errors[leastKey]
+                nb+=least
+                error+=least
+            counts[key]=nb
+            self.errors[key]=error
+        if self.size>0:
+            heapq.heappush(self.heap,(counts[key],key))
+            if len(self.heap)>4*self.size: # drop the outdated entries
+                self.heap=[(nb,key) for (key,nb) in counts.items()]
+                heapq.heapify(self.heap)
+
+    def popLeast(self):
+        while True:
+            (nb,key)=heapq.heappop(self.heap)
+            if self.counts.get(key)==nb:
+                return (nb,key)
+
+    ## add the counts of another table
+    def merge(self,other):
+        for (key,nb,error) in other.items():
+            self.add(key,nb,error)
+
+    ## (type,count,error) sorted by decreasing count
+    def items(self):
+        return sorted([(key,nb,self.errors[key]) for (key,nb) in self.counts.items()],key=lambda i:i[1],reverse=True)
+
 # error type table for statistics
-errorTable={}
-def printErrorStatistics():
-    global errorTable
-    if len(errorTable)==0:return
-    errors=sorted(errorTable.items(),key=lambda i:i[1],reverse=True)
-    print ("Error Statistics")
-    for (mess,nb) in errors:
-        print (showNum(nb,15)+"\t"+mess)
-
-# list of ids of erroneous objects
+errorTable=TopCounts()
+def printErrorStatistics(table=None,title="Error Statistics"):
+    if table==None: table=errorTable
+    if len(table)==0:return
+    out=summaryOutput()
+    print (title,file=out)
+    for (mess,nb,error) in table.items():
+        print (showNum(nb,15)+"\t"+mess+("" if error==0 else "\t(overestimated by at most "+showNum(error)+")"),file=out)
+
+# ids of erroneous objects kept as ranges for a sed command (e.g. "3,7p;10p"):
+#  [first,last] for consecutive line numbers, [id,None] for other ids
 errorIdList=[]
+sedIds=False     # keep the ids, only when their list is output (--sed or --sed-file)
+sedOutput=None   # file in which the ranges are written as soon as they are complete, None for printing them at the end
+sedCopied=False  # sedOutput is a temporary file copied to the output when the list is complete (--sed)
+sedSeparator=""  # written before the next range in sedOutput
+
+def sedRange(r):
+    return (str(r[0]) if r[1]==None or r[0]==r[1] else "%d,%d"%(r[0],r[1]))+"p"
+
+## add the id of an invalid record, a line number (int) extending the last range when they are consecutive;
+#  the other ids (e.g. given by -id) are kept as they appear
+def addErrorId(recordId):
+    global sedSeparator
+    if not(sedIds): return
+    isLine=type(recordId) is int
+    if isLine and len(errorIdList)>0 and errorIdList[-1][1]!=None and recordId==errorIdList[-1][1]+1:
+        errorIdList[-1][1]+=1
+        return
+    if sedOutput!=None and len(errorIdList)>0: # the last range is complete
+        sedOutput.write(sedSeparator+sedRange(errorIdList.pop()))
+        sedSeparator=";"
+    errorIdList.append([recordId,recordId] if isLine else [str(recordId),None])
+
 def printErrorIdList():
-    global errorIdList
-    print (";".join([id+"p" for id in errorIdList]))
+    global sedSeparator
+    ranges=";".join([sedRange(r) for r in errorIdList])
+    errorIdList.clear()
+    if sedOutput!=None:
+        sedOutput.write((sedSeparator if ranges!="" else "")+ranges+"\n")
+        sedSeparator=""
+        if sedCopied:
+            sedOutput.seek(0)
+            shutil.copyfileobj(sedOutput,summaryOutput())
+            sedOutput.seek(0)
+            sedOutput.truncate()
+    else:
+        print (ranges,file=summaryOutput())
+
+## type of an error message line for the statistics: path and message, 
+#  the indices in the path being replaced by [*] unless exactPaths
+#  (a line without a path, e.g. the heading of the messages of alternatives, is kept as is)
+def errorType(messLine):
+    fields=messLine.split("\t")[0:2]
+    if len(fields)<2 or exactPaths:
+        return ":".join(fields)
+    return INDEX_RE.sub("[*]",fields[0])+":"+fields[1]
+
+## update the error statistics (errorTable by default) with the lines of a validation message
+def addErrorStatistics(mess,table=None):
+    if table==None: table=errorTable
+    for messLine in mess.split("\n")[0:-1]: ## mess can contain more than one error message
+        table.add(errorType(messLine))
+        if "does not match any alternative" in messLine:
+            break # stats for only the first line of alternative errors 
+
+## messages of the validation of a json object according to a json schema ("" when it is valid)
+#  root is the schema containing the definitions when schema is only a part of it
+#  refs: references traversed by the previous records of the file (see RefTraversal), None for a single record
+#  sels: path of the object, e.g. ((),3) for the element [3] of a top-level array validated with --stream
+def checkObject(obj,schema,root=None,refs=None,sels=()):
+    global rootSchema
+    rootSchema=schema if root==None else root
+    return validate(sels,schema,None,obj,RefTraversal() if refs==None else refs)
 
-## validate a single json object (json), identified by recordId (a string), according to a json schema
-def validateObject(obj,recordId, schema,logMessages,traceRead):
-    global rootSchema,errorTable, errorIdList,traceValidate
-    rootSchema=schema
+## log and count the errors of a record given the messages of its validation and its value as shown by showVal
+#  offset is the position of the record in the input file (None if unknown)
+#  table is the error statistics table to update (errorTable by default)
+#  returns True when there is no error
+def reportErrors(mess,recordId,shown,logMessages,offset=None,table=None):
+    if mess=="": return True
+    addErrorId(recordId)
+    if logMessages:
+        logMessage(str(recordId)+":"+shown+"\n"+mess,recordId,offset,mess)
+    addErrorStatistics(mess,table)
+    return False
+
+## validate a single json object (json), identified by recordId (a string or a line number), according to a json schema
+def validateObject(obj,recordId, schema,logMessages,traceRead,offset=None,root=None,table=None,refs=None,sels=()):
+    global traceValidate
     traceValidate=traceRead
-    mess=validate([],schema,None,obj)
-    if mess!="":
-        errorIdList.append(recordId)
-        if logMessages:
-            print (recordId+":"+showVal(obj,100)+"\n"+mess,end="")
-        for messLine in mess.split("\n")[0:-1]: ## mess can contain more than one error message
-            messType=":".join(messLine.split("\t")[0:2])
-            if messType in errorTable: 
-                errorTable[messType]+=1
-            else: 
-                errorTable[messType]=1
-            if re.search("does not match any alternative",messLine):
-                break # stats for only the first line of alternative errors 
-        return False
-    return True
+    mess=checkObject(obj,schema,root,refs,sels)
+    return reportErrors(mess,recordId,showVal(obj,100) if mess!="" else "",logMessages,offset,table)
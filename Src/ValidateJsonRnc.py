@@ -6,15 +6,58 @@
 ##   revision for adding statistics on error messages, May 2015
 ########################################################################
 
-import pprint,json,os,datetime,argparse,sys
+import pprint,json,os,datetime,argparse,sys,time,glob,tempfile,shutil,multiprocessing,signal
 
 ## flag for debugging
 traceRead=False
 
+## parameters of the follow mode
+followPoll=0.5    # number of seconds between checks for new lines
+followEvery=60    # number of seconds between outputs of the statistics
+followStats=False # output error statistics with the follow statistics
+
+## validation engine: "object" decodes each record before validating it,
+#                     "fused" validates the text of each record while scanning it (see ValidateJsonText)
+#                     "columnar" checks batches of records field by field when the schema is flat (see ValidateColumns)
+engine="object"
+batchSize=10000    # number of records decoded together by the columnar engine
+fusedMessages=True # decode the records rejected by the fused engine to produce their messages and statistics
+
+## files in which the original text of the records is written according to their validity
+validOut=None
+invalidOut=None
+quarantineOut=None # malformed json and duplicate fields, in invalidOut if None
+
+## cache of the messages of the validation of records keyed by their text (see ValidateJsonObject.LruCache), None when not used
+recordMemo=None
+
+## processor time (in seconds) allowed for decoding and validating a record, None for no limit
+#  a timer (setitimer) is armed for each record; when it expires, the record is reported as a "validation timeout" error
+recordTimeout=None
+timing=False # True while a record is validated so that a late expiration of the timer is ignored
+
+class RecordTimeout(Exception):
+    pass
+
+def expireRecordTimeout(signum,frame):
+    if timing:
+        raise RecordTimeout()
+
+## routing of the records to schemas according to the value of a discriminator (see getRouting), None when not used
+routing=None
+
 from ppJson             import ppJson
 from ParseJsonRnc       import parseJsonRnc
-from SplitJson          import jsonSplitter
-from ValidateJsonObject import validateObject,errorSchema,printErrorStatistics,printErrorIdList,showNum
+from SplitJson          import jsonSplitter,jsonContainerItems
+from ValidateJsonText   import validateText
+from ProjectSchema      import projectSchema
+from ExplainSchema      import explainSchema,printExplanation
+from OptimizeSchema     import optimizeSchema
+from ValidateColumns    import recordPlan,checkBatches,traverseRefs
+import ValidateJsonObject
+from ValidateJsonObject import validateObject,errorSchema,errorValidate,printErrorStatistics,printErrorIdList,showNum,\
+                               logMessage,flushOutput,summaryOutput,addErrorStatistics,addErrorId,TopCounts,\
+                               checkObject,reportErrors,showVal,LruCache,memoizeRefs,riskyPatterns,RefTraversal
 
 # recursively search for a value in an object
 # sels is a list of field names
@@ -37,53 +80,319 @@ def duplicate_check_hook(pairs):
     return result
 
 
+## write the original text of a record in one of the partition files (if it is given)
+def writeRecord(out,inJson):
+    if out==None:return
+    if type(inJson) is not bytes:
+        inJson=inJson.encode("utf-8")
+    out.write(inJson)
+    if not inJson.endswith(b"\n"):
+        out.write(b"\n")
+
+###
+#  read a routing table: a JSON object mapping values of the discriminator selected by routeStr
+#  (e.g. "source" or "meta/kind") to JSON-RNC files, relative to the directory of the table;
+#  records whose value is missing or not in the table are validated with the fallback schema (route "*")
+#  returns None when the table or one of its schemas cannot be read
+def getRouting(routeStr,routesFile,fallback):
+    if not os.path.exists(routesFile):
+        print ("routing table not found: "+routesFile)
+        return None
+    try:
+        table=json.load(open(routesFile))
+    except ValueError as mess:
+        print ("bad routing table: "+routesFile+": "+str(mess))
+        return None
+    if type(table) is not dict:
+        print ("the routing table must be a JSON object: "+routesFile)
+        return None
+    schemas={} # schemas by file name, so that a schema shared by many values is read only once
+    routes={}
+    for (value,jsonrncFile) in table.items():
+        jsonrncFile=os.path.join(os.path.dirname(routesFile),jsonrncFile)
+        if jsonrncFile not in schemas:
+            schemas[jsonrncFile]=getSchema(jsonrncFile)
+            if schemas[jsonrncFile]==None:return None
+        routes[value]=schemas[jsonrncFile]
+    # number of records, of invalid ones and error statistics for each route
+    stats={name:{"nb":0,"invalid":0,"errors":TopCounts()} for name in list(routes)+["*"]}
+    return {"sels":routeStr.split("/"),"routes":routes,"fallback":fallback,"stats":stats}
+
+## find the schema and the statistics of the route of a decoded record
+def routeRecord(obj):
+    value=select(routing["sels"],obj) if type(obj) is dict else None
+    if value!=None and type(value) is not str:
+        value=json.dumps(value) # e.g. 1 or true are given as "1" or "true" in the routing table
+    if value in routing["routes"]:
+        return (routing["routes"][value],routing["stats"][value])
+    return (routing["fallback"],routing["stats"]["*"])
+
+## print the number of records and of invalid ones for each route
+def printRouteStatistics():
+    out=summaryOutput()
+    print ("Routes according to "+"/".join(routing["sels"]),file=out)
+    for (name,route) in routing["stats"].items():
+        print (showNum(route["nb"],15)+" objects read: "+showNum(route["invalid"])+" invalid\t"+name,file=out)
+
+def printRouteErrorStatistics():
+    for (name,route) in routing["stats"].items():
+        printErrorStatistics(route["errors"],"Error Statistics for route "+name)
+
 ###########
 ### validate a stream of json objects within a file according to a schema
+#   or according to the schema of their route when routing is used
 #   prints the number of invalid objects
 #   when no message are logged, print something on stderr every 10000 records
 def validateStream(schema,idStr,stream,logMessages):
+    global timing
     if '$schema' not in schema or schema['$schema']!='http://json-schema.org/draft-07/schema#':
         print (errorSchema([],"bad schema!!!",""))
         return
+    if recordTimeout!=None:
+        signal.signal(signal.SIGPROF,expireRecordTimeout)
     idFn=None if idStr==None else lambda o:select(idStr.split("/"),o)
+    idSels=None if idStr==None else idStr.split("/")
     nb=0
     nbInvalid=0
     nbBad=0
     nbDup=0
     allIds=dict()
+    offset=0
+    recordOffset=None
+    refs=RefTraversal() # references traversed by the records of the stream
+    plan=None # checks of the columnar engine, None when the records are validated one at a time
+    if engine=="columnar" and routing==None:
+        plan=recordPlan(schema,recordTimeout==None) # patterns are only checked within the time limit of a record
+        if plan==None:
+            sys.stderr.write("the schema is not flat: the records are validated one at a time\n")
+        else:
+            stream=checkBatches(stream,plan,batchSize,lambda text:json.loads(text,object_pairs_hook=duplicate_check_hook))
     for inJson in stream:
         try:
-            if traceRead:print ("$$$inJson="+inJson)
+            if plan!=None:
+                (inJson,decoded,checked)=inJson
+            if traceRead:print ("$$$inJson=%s"%inJson)
             nb+=1
-            obj=json.loads(inJson,object_pairs_hook=duplicate_check_hook)
-            id=str(nb)
-            if idFn!=None:
-                val=idFn(obj)
-                if val!=None:
-                    if val in allIds:  # check for duplicate id
-                        print ("record %d :duplicate id:%s already used for record no %d"%(nb,val,allIds[val]))
-                    else:
-                        allIds[val]=nb
-                    id=val
-            if not(validateObject(obj,id,schema,logMessages,traceRead)):
+            if type(inJson) is bytes: # byte offsets are only known for lines read from a file
+                recordOffset=offset
+                offset+=len(inJson)
+            val=None
+            valid=None
+            mess=None  # messages of the validation, None when the record is rejected by the fused engine without them
+            shown=""   # value of the record shown in the messages
+            route=None # statistics of the route of the record
+            memo=None if recordMemo==None else getRecordMemo(inJson,refs)
+            if memo!=None:
+                (mess,shown,val,route)=memo[0:4]
+            else:
+                workStart=time.perf_counter()
+                timedOut=False
+                if recordMemo!=None:
+                    nbTraversed=len(refs.traversed)
+                    refs.record()
+                try:
+                    if recordTimeout!=None:
+                        timing=True
+                        signal.setitimer(signal.ITIMER_PROF,recordTimeout)
+                    if engine=="fused" and routing==None: # the route of a record is only known once it is decoded
+                        (valid,val)=validateText(inJson,schema,idSels,fusedMessages,refs)
+                        if not(valid) and (fusedMessages or (idFn!=None and val==None)):
+                            valid=None # decode the rejected record for its messages or its id
+                        elif valid:
+                            mess=""
+                    if valid==None:
+                        if plan==None:
+                            obj=json.loads(inJson,object_pairs_hook=duplicate_check_hook)
+                        elif isinstance(decoded,Exception): # raised when the batch was decoded
+                            raise decoded
+                        else:
+                            obj=decoded
+                        if idFn!=None:
+                            val=idFn(obj)
+                        (recordSchema,route)=(schema,None) if routing==None else routeRecord(obj)
+                        if plan!=None and checked:
+                            traverseRefs(plan,obj,refs)
+                            mess=""
+                        else: # messages of the rows that failed
+                            mess=checkObject(obj,recordSchema,None,refs)
+                        if mess!="": shown=showVal(obj,100)
+                except RecordTimeout:
+                    mess=errorValidate([],"validation timeout:","more than %g s of processor time"%recordTimeout)
+                    shown=showVal((inJson.decode("utf-8","replace") if type(inJson) is bytes else inJson).strip(),100)
+                    timedOut=True
+                finally:
+                    if recordTimeout!=None:
+                        timing=False
+                        signal.setitimer(signal.ITIMER_PROF,0)
+                if recordMemo!=None:
+                    followed=refs.recorded(0)
+                    # as in ValidateJsonObject.validateMemo, the messages whose paths show references traversed
+                    # for the first time are not kept and a record is kept with the references followed for it
+                    if mess!=None and not(timedOut):
+                        recordMemo.workTime+=time.perf_counter()-workStart
+                        if len(refs.traversed)==nbTraversed:
+                            recordMemo.put(inJson,(mess,shown,val,route,followed))
+            id=nb # line number, unless the record has an id
+            if val!=None:
+                if val in allIds:  # check for duplicate id
+                    logMessage("record %d :duplicate id:%s already used for record no %d\n"%(nb,val,allIds[val]),str(nb),recordOffset,
+                               errorValidate([],"duplicate id:",str(val)))
+                else:
+                    allIds[val]=nb
+                id=str(val)
+            if mess!=None:
+                valid=reportErrors(mess,id,shown,logMessages,recordOffset,None if route==None else route["errors"])
+                if route!=None:
+                    route["nb"]+=1
+                    if not(valid): route["invalid"]+=1
+            else:
+                addErrorId(id)
+            if valid:
+                writeRecord(validOut,inJson)
+            else:
+                writeRecord(invalidOut,inJson)
                 nbInvalid+=1
             if not(logMessages) and nb%10000==0:
                 sys.stderr.write("Processing record "+str(nb)+"\n")
         except ValueError as mess:
             if logMessages:
-                print ("Item "+str(nb)+": bad json object:"+str(mess))
+                logMessage("Item "+str(nb)+": bad json object:"+str(mess)+"\n",str(nb),recordOffset,
+                           errorValidate([],"bad json object:",str(mess)))
+            writeRecord(quarantineOut or invalidOut,inJson)
             nbBad+=1
         except KeyError as mess:
             if logMessages:
-                print ("Item "+str(nb)+":"+mess.args[0])
+                logMessage("Item "+str(nb)+":"+mess.args[0]+"\n",str(nb),recordOffset,errorValidate([],mess.args[0],""))
+            writeRecord(quarantineOut or invalidOut,inJson)
             nbDup+=1
+    printSummary(nb,nbInvalid,nbBad,nbDup)
+    if routing!=None:
+        printRouteStatistics()
+    printMemoStatistics()
+    return nbInvalid
+
+## find the cached validation of the text of a record, timing the lookup; it is used only when the references
+#  followed for it have been traversed (refs), as its messages would then be the same
+def getRecordMemo(inJson,refs):
+    start=time.perf_counter()
+    memo=recordMemo.get(inJson,lambda memo:memo[4]<=refs.traversed)
+    recordMemo.lookupTime+=time.perf_counter()-start
+    return memo
+
+## print the hit rates of the caches of records and of memoized definitions
+def printMemoStatistics():
+    caches=([recordMemo] if recordMemo!=None else [])+ValidateJsonObject.memoCaches
+    if len(caches)==0: return
+    out=summaryOutput()
+    print ("Memoization",file=out)
+    for cache in caches:
+        print ("   "+cache.summary(),file=out)
+
+## print the number of objects read and of invalid ones
+def printSummary(nb,nbInvalid,nbBad,nbDup):
+    flushOutput()
+    out=summaryOutput()
     if nbInvalid==0 and nbBad==0 and nbDup==0:
         if nb==1:
-            print ("The object is valid")
+            print ("The object is valid",file=out)
         else:
-            print ("The "+showNum(nb)+" objects are valid")
+            print ("The "+showNum(nb)+" objects are valid",file=out)
     else:
-        print (showNum(nb)+" objects read: "+showNum(nbInvalid)+" invalid, "+showNum(nbBad)+" bad, " + showNum(nbDup)+ " with duplicate fields")
+        print (showNum(nb)+" objects read: "+showNum(nbInvalid)+" invalid, "+showNum(nbBad)+" bad, " + showNum(nbDup)+ " with duplicate fields",file=out)
+
+## follow the references of an optimized schema (see OptimizeSchema) until a type or a list of alternatives
+#  (without traversing them for the paths of the messages)
+def resolveRef(schema):
+    while "$ref" in schema and "schema" in schema:
+        schema=schema["schema"]
+    return schema
+
+###########
+### validate, one at a time, the elements of a JSON array or the values of a JSON object with arbitrary keys 
+#   that makes up the whole stream, against the 'items' or 'additionalProperties' of the schema
+#   elements are identified by their index or key (or by idStr); 
+#   minItems, maxItems, minProperties and maxProperties are checked by counting the elements
+#   when the schema is not an array or an object with arbitrary keys, the whole stream is validated as a single object
+#   returns the number of invalid elements (the container counts as one when its length is wrong)
+def validateContainer(schema,idStr,stream,logMessages):
+    if '$schema' not in schema or schema['$schema']!='http://json-schema.org/draft-07/schema#':
+        print (errorSchema([],"bad schema!!!",""))
+        return 0
+    top=resolveRef(schema)
+    if top.get("type")=="array" and "items" in top:
+        (kind,elemSchema,minFacet,maxFacet)=("array",top["items"],"minItems","maxItems")
+    elif top.get("type")=="object" and type(top.get("additionalProperties")) is dict:
+        (kind,elemSchema,minFacet,maxFacet)=("object",top["additionalProperties"],"minProperties","maxProperties")
+    else:
+        sys.stderr.write("The schema is not an array or an object with arbitrary keys: the input is validated as a single object\n")
+        return validateStream(schema,idStr,[stream.read()],logMessages)
+    idFn=None if idStr==None else lambda o:select(idStr.split("/"),o)
+    duplicates=[]
+    def duplicate_record_hook(pairs): # record duplicate keys instead of stopping the decoding of the element
+        result=dict()
+        for key,val in pairs:
+            if key in result:
+                duplicates.append(key)
+            result[key]=val
+        return result
+    items=jsonContainerItems(stream,json.JSONDecoder(object_pairs_hook=duplicate_record_hook))
+    nb=0
+    nbInvalid=0
+    nbBad=0
+    nbDup=0
+    allIds=dict()
+    keys=set() # keys of a top-level object for checking that they are all different, the only memory growing with the input
+    refs=RefTraversal() # references traversed by the elements
+    try:
+        if next(items)!=kind:
+            logMessage("Item 1: bad json object:"+kind+" expected\n","1",None,errorValidate([],"bad json object:",kind+" expected"))
+            printSummary(1,0,1,0)
+            return 0
+        for (key,obj) in items:
+            nb+=1
+            id="["+str(key)+"]" if kind=="array" else key
+            if len(duplicates)>0:
+                if logMessages:
+                    logMessage("Item "+id+":duplicate key: "+duplicates[0]+"\n",id,None,errorValidate([],"duplicate key: "+duplicates[0],""))
+                duplicates.clear()
+                nbDup+=1
+                continue
+            if kind=="object":
+                if key in keys:
+                    if logMessages:
+                        logMessage("Item "+id+":duplicate key: "+key+"\n",id,None,errorValidate([],"duplicate key: "+key,""))
+                    nbDup+=1
+                    continue
+                keys.add(key)
+            if idFn!=None:
+                val=idFn(obj)
+                if val!=None:
+                    if val in allIds:  # check for duplicate id
+                        logMessage("record %s :duplicate id:%s already used for record %s\n"%(id,val,allIds[val]),id,None,
+                                   errorValidate([],"duplicate id:",str(val)))
+                    else:
+                        allIds[val]=id
+                    id=str(val)
+            if not(validateObject(obj,id,elemSchema,logMessages,traceRead,None,schema,None,refs,((),key))):
+                nbInvalid+=1
+            if not(logMessages) and nb%10000==0:
+                sys.stderr.write("Processing element "+str(nb)+"\n")
+    except ValueError as mess:
+        if logMessages:
+            logMessage("Item "+str(nb+1)+": bad json object:"+str(mess)+"\n",str(nb+1),None,
+                       errorValidate([],"bad json object:",str(mess)))
+        nbBad+=1
+    mess=""
+    if minFacet in top and nb<top[minFacet]:
+        mess+=errorValidate([],kind+" length less than "+str(top[minFacet]),showNum(nb))
+    if maxFacet in top and nb>top[maxFacet]:
+        mess+=errorValidate([],kind+" length greater than "+str(top[maxFacet]),showNum(nb))
+    if mess!="":
+        if logMessages:
+            logMessage("top-level "+kind+":\n"+mess,kind,None,mess)
+        addErrorStatistics(mess)
+        nbInvalid+=1
+    printSummary(nb,nbInvalid,nbBad,nbDup)
     return nbInvalid
 
 
@@ -107,7 +416,222 @@ def validateObjects(schema,idStr,fileName,logMessages):
 #  returns the number of invalid lines
 def validateLines(schema,idStr,fileName,logMessages):
     if traceRead:print ("validateLines(%s,%s)"%(schema,fileName))
-    return validateStream(schema,idStr,open(fileName) if fileName!=None else sys.stdin,logMessages)        
+    return validateStream(schema,idStr,open(fileName,"rb") if fileName!=None else sys.stdin.buffer,logMessages)
+
+###
+#  generator that follows a JSON lines file as it grows (a la "tail -f")
+#  yields the lines (as bytes) already in the file, then the ones appended to it;
+#  a partial trailing line is kept until its newline has been written.
+#  The file is read again from its start when it is truncated or replaced by a new one (log rotation).
+#  The output is flushed after each chunk read, so that verdicts are shown as soon as possible;
+#  the delay between the last modification of the file and the output of the verdicts is measured
+#  and shown periodically with the statistics. Stops on a keyboard interrupt (^C)
+def followLines(fileName):
+    if traceRead:print ("followLines(%s)"%fileName)
+    f=open(fileName,"rb")
+    startTime=time.time()
+    lastStats=startTime
+    pending=b""
+    rotated=False
+    latency={"lines":0,"nb":0,"total":0.0,"max":0.0}
+    def printFollowStatistics():
+        nb=latency["nb"]
+        out=summaryOutput()
+        print (showNum(latency["lines"])+" lines followed; latency of verdicts: "+
+               ("average %.1f ms, maximum %.1f ms"%(1000*latency["total"]/nb,1000*latency["max"]) if nb>0 else "none measured"),file=out)
+        if routing!=None:
+            printRouteStatistics()
+        if followStats:
+            printRouteErrorStatistics() if routing!=None else printErrorStatistics()
+        out.flush()
+    try:
+        while True:
+            chunk=f.read(1<<16)
+            if len(chunk)>0:
+                mtime=os.fstat(f.fileno()).st_mtime
+                lines=(pending+chunk).split(b"\n")
+                pending=lines.pop() # incomplete last line (empty when the chunk ends with a newline)
+                for line in lines:
+                    latency["lines"]+=1
+                    yield line+b"\n"
+                flushOutput()
+                if mtime>=startTime and len(lines)>0: # do not measure for lines present before the start
+                    delay=time.time()-mtime
+                    latency["nb"]+=len(lines)
+                    latency["total"]+=delay*len(lines)
+                    latency["max"]=max(latency["max"],delay)
+                now=time.time()
+                if now-lastStats>=followEvery: # also when the file grows faster than it is read
+                    printFollowStatistics()
+                    lastStats=now
+                continue
+            if rotated: # the old file has been completely read, continue with the new one
+                if len(pending)>0:
+                    yield pending
+                f.close()
+                f=open(fileName,"rb")
+                pending=b""
+                rotated=False
+                continue
+            now=time.time()
+            if now-lastStats>=followEvery:
+                printFollowStatistics()
+                lastStats=now
+            time.sleep(followPoll)
+            try:
+                st=os.stat(fileName)
+            except FileNotFoundError: # file is being rotated
+                continue
+            if st.st_ino!=os.fstat(f.fileno()).st_ino:
+                rotated=True
+            elif st.st_size<f.tell(): # file truncated
+                f.seek(0)
+                pending=b""
+    except KeyboardInterrupt:
+        pass
+    finally:
+        f.close()
+    printFollowStatistics()
+
+###
+#  validate a file (stdin when fileName is None) according to the way its records are given:
+#  "stream", "slurp", "split" or "lines" (see the command line arguments)
+#  returns the number of invalid objects
+def validateFile(schema,idStr,fileName,logMessages,mode):
+    if mode=="stream":
+        return validateContainer(schema,idStr,open(fileName,encoding="utf-8") if fileName!=None else sys.stdin,logMessages)
+    if mode=="slurp":
+        return validateStream(schema,idStr,[(open(fileName,"rb") if fileName!=None else sys.stdin.buffer).read()],logMessages)
+    if mode=="split":
+        return validateObjects(schema,idStr,fileName,logMessages)
+    return validateLines(schema,idStr,fileName,logMessages)
+
+###########
+### batch mode: validation of many files by a pool of processes sharing the schema loaded once
+#   each process validates a file at a time, writing its messages in temporary files that are 
+#   output with a summary for each file once it is validated; statistics are then aggregated over all files
+batch=None # schema and options of the validation of each file, set in each process by initBatch
+
+def initBatch(settings):
+    global batch,engine,batchSize,fusedMessages,routing,traceRead,recordMemo,recordTimeout
+    batch=settings
+    batchSize=settings["batchSize"]
+    recordTimeout=settings["recordTimeout"]
+    (engine,fusedMessages,routing,traceRead)=(settings["engine"],settings["fusedMessages"],settings["routing"],settings["traceRead"])
+    recordMemo=settings["recordMemo"]
+    ValidateJsonObject.traceValidate=traceRead
+    ValidateJsonObject.outputFormat=settings["outputFormat"]
+    ValidateJsonObject.topSize=settings["topSize"]
+    ValidateJsonObject.exactPaths=settings["exactPaths"]
+    ValidateJsonObject.sedIds=settings["sed"]
+    if settings["sed"]: # the ranges of each file are kept in a temporary file of the process
+        ValidateJsonObject.sedOutput=tempfile.TemporaryFile("w+",encoding="utf-8")
+        ValidateJsonObject.sedCopied=True
+
+## expand the glob patterns of a list of file names, keeping the patterns that match no file so that they are reported
+def expandFiles(patterns):
+    files=[]
+    for pattern in patterns:
+        matches=sorted(glob.glob(pattern)) if glob.has_magic(pattern) else []
+        files.extend(matches if len(matches)>0 else [pattern])
+    return list(dict.fromkeys(files)) # remove duplicates keeping the order
+
+###
+#  validate a file of the batch, with fresh statistics, catching all errors so that they do not stop the batch
+#  returns a dict with the name of the file, its number of invalid objects, 
+#          an error message when it could not be validated, the names of the temporary files with its output
+#          and its statistics
+def validateBatchFile(fileName):
+    ValidateJsonObject.errorTable=TopCounts()
+    ValidateJsonObject.errorIdList.clear()
+    ValidateJsonObject.recordFile=fileName
+    if routing!=None:
+        for route in routing["stats"].values():
+            route.update({"nb":0,"invalid":0,"errors":TopCounts()})
+    out=tempfile.NamedTemporaryFile("w",encoding="utf-8",prefix="validate-",suffix=".out",delete=False)
+    err=tempfile.NamedTemporaryFile("w",encoding="utf-8",prefix="validate-",suffix=".err",delete=False)
+    (stdout,stderr)=(sys.stdout,sys.stderr)
+    (sys.stdout,sys.stderr)=(out,err)
+    result={"file":fileName,"invalid":0,"failed":None,"out":out.name,"err":err.name}
+    try:
+        if not os.path.exists(fileName):
+            result["failed"]="no file matches this pattern" if glob.has_magic(fileName) else "json file not found"
+        else:
+            mode=batch["mode"] or ("split" if fileName.endswith(".json") else "lines")
+            result["invalid"]=validateFile(batch["schema"],batch["id"],fileName,batch["logMessages"],mode) or 0
+            if batch["sed"]:
+                flushOutput()
+                printErrorIdList()
+    except Exception as mess:
+        ValidateJsonObject.outputBuffer.clear() # keep only the messages already output
+        result["failed"]=type(mess).__name__+": "+str(mess)
+    finally:
+        flushOutput()
+        (sys.stdout,sys.stderr)=(stdout,stderr)
+        out.close()
+        err.close()
+    result["errors"]=ValidateJsonObject.errorTable
+    result["routes"]=routing["stats"] if routing!=None else None
+    return result
+
+###
+#  validate many files, the largest first for balancing the load of the processes (jobs is their number)
+#  outputs the messages and summary of each file as soon as it is validated (in the order of validation),
+#  then a summary of the batch; errors in a file are reported without stopping the batch
+#  returns the total number of invalid objects plus the number of files that could not be validated
+def validateBatch(schema,idStr,fileNames,logMessages,mode,sed,jobs):
+    fileNames=sorted(fileNames,key=lambda f:os.path.getsize(f) if os.path.exists(f) else -1,reverse=True)
+    settings={"schema":schema,"id":idStr,"logMessages":logMessages,"mode":mode,"sed":sed,
+              "engine":engine,"batchSize":batchSize,"fusedMessages":fusedMessages,"routing":routing,"traceRead":traceRead,"recordMemo":recordMemo,"recordTimeout":recordTimeout,
+              "outputFormat":ValidateJsonObject.outputFormat,
+              "topSize":ValidateJsonObject.topSize,"exactPaths":ValidateJsonObject.exactPaths}
+    if jobs>1:
+        pool=multiprocessing.Pool(min(jobs,len(fileNames)),initBatch,(settings,))
+        results=pool.imap(validateBatchFile,fileNames)
+    else:
+        pool=None
+        initBatch(settings)
+        results=map(validateBatchFile,fileNames)
+    nbFiles=0
+    nbInvalidFiles=0
+    nbFailed=0
+    totalInvalid=0
+    allErrors=TopCounts()
+    allRoutes={}
+    for result in results:
+        nbFiles+=1
+        out=summaryOutput()
+        print ("== "+result["file"],file=out)
+        out.flush()
+        for (name,dest) in [("out",sys.stdout),("err",sys.stderr)]:
+            with open(result[name],encoding="utf-8") as f:
+                shutil.copyfileobj(f,dest)
+            dest.flush()
+            os.remove(result[name])
+        if result["failed"]!=None:
+            print ("file not validated: "+result["failed"],file=out)
+            nbFailed+=1
+        if result["invalid"]>0:
+            nbInvalidFiles+=1
+            totalInvalid+=result["invalid"]
+        allErrors.merge(result["errors"])
+        for (name,route) in (result["routes"] or {}).items():
+            total=allRoutes.setdefault(name,{"nb":0,"invalid":0,"errors":TopCounts()})
+            total["nb"]+=route["nb"]
+            total["invalid"]+=route["invalid"]
+            total["errors"].merge(route["errors"])
+    if pool!=None:
+        pool.close()
+        pool.join()
+    out=summaryOutput()
+    print ("== "+showNum(nbFiles)+" files validated: "+showNum(nbInvalidFiles)+" with invalid objects ("+
+           showNum(totalInvalid)+" in all), "+showNum(nbFailed)+" not validated",file=out)
+    # aggregated statistics replace those of the last file validated in this process
+    ValidateJsonObject.errorTable=allErrors
+    ValidateJsonObject.recordFile=None
+    if routing!=None:
+        routing["stats"]=allRoutes
+    return totalInvalid+nbFailed
 
 ## taken from http://stackoverflow.com/questions/237079/how-to-get-file-creation-modification-date-times-in-python
 def modificationDate(filename):
@@ -117,9 +641,9 @@ def modificationDate(filename):
 ## save a schema as a JSON Schema file
 def saveSchema(schema,pythonSchemaFileName):
     if traceRead:print ("saveSchema:"+pythonSchemaFileName)
-    out=open(pythonSchemaFileName,"w")
-    # json.dump(schema,out,indent=3,separators=(',', ': '))
-    ppJson(out,schema)
+    with open(pythonSchemaFileName,"w") as out:
+        # json.dump(schema,out,indent=3,separators=(',', ': '))
+        ppJson(out,schema)
     return schema
 
 ## read an existing schema
@@ -159,25 +683,172 @@ if __name__ == '__main__':
                                    "for identifying records in error messages instead of line numbers")
     parser.add_argument("--stats","-st",help="Output statistics about error messages",action="store_true")
     parser.add_argument("--nolog",help="Do not log error messages",action="store_true")
-    parser.add_argument("--sed",help="Output list of erroneous ids in sed compatible format",action="store_true")
-    parser.add_argument("schema",help="name of file containing the schema")
-    parser.add_argument("json_file",help="name of the JSON file to validate",nargs='?')
+    parser.add_argument("--sed",help="Output list of erroneous ids in sed compatible format, consecutive line numbers as ranges (e.g. '3,7p;10p')",
+                        action="store_true")
+    parser.add_argument("--sed-file",help="Write the list of erroneous ids of --sed in this file during the validation")
+    parser.add_argument("--top",help="Maximum number of error types counted in the statistics (default 1000, 0 for no limit); "+
+                        "when there are more types, the least frequent ones are dropped and counts become upper bounds",type=int,default=1000)
+    parser.add_argument("--exact-paths",help="Keep the indices of arrays (e.g. books/[17]/title) in the statistics "+
+                        "instead of replacing them by [*] (e.g. books/[*]/title)",action="store_true")
+    parser.add_argument("--stream",help="Validate one at a time the elements of the top-level array "+
+                        "or the values of the top-level object with arbitrary keys ({*:type}) of the input "+
+                        "(the keys of an object being kept for checking that they are all different)",action="store_true")
+    parser.add_argument("--engine",help="Validation engine: 'object' (default) decodes each record before validating it, "+
+                        "'fused' checks the text of the record against the schema while scanning it and stops at the first error "+
+                        "(not used with --stream or --route), a rejected record being then decoded in full and validated again "+
+                        "for its messages unless --nolog is given without --stats, 'columnar' decodes batches of records and checks the types and facets "+
+                        "of each field over the whole batch, validating one at a time only the records that fail "+
+                        "(used when the records are flat objects, not with --stream, --route or --follow)",
+                        choices=["object","fused","columnar"],default="object")
+    parser.add_argument("--batch-size",help="Number of records decoded together by the columnar engine (default 10000)",type=int,default=10000)
+    parser.add_argument("--valid-out",help="Write the original text of the valid records in this file")
+    parser.add_argument("--invalid-out",help="Write the original text of the invalid records in this file")
+    parser.add_argument("--quarantine",help="Write the original text of the malformed records and of those with duplicate fields "+
+                                            "in this file instead of the one given by --invalid-out")
+    parser.add_argument("--follow","-f",help="Keep validating the lines appended to the JSON lines file until interrupted (^C)",action="store_true")
+    parser.add_argument("--poll",help="Number of seconds between checks for new lines in follow mode (default 0.5)",type=float,default=0.5)
+    parser.add_argument("--output-format","-of",help="Format of the error messages: text (default), "+
+                        "or jsonl and tsv for a row for each error (record id, byte offset, path, message, value); "+
+                        "summaries and statistics are then output on stderr",choices=["text","jsonl","tsv"],default="text")
+    parser.add_argument("--every",help="Number of seconds between outputs of statistics in follow mode (default 60)",type=float,default=60)
+    parser.add_argument("--route",help="Validate each record with the schema given by the routing table (--routes) for the value "+
+                        "of this selector, a list of keys separated by slashes as for -id (e.g. 'source'); "+
+                        "the schema given as argument is used for the other values; statistics are given for each route")
+    parser.add_argument("--routes",help="JSON file with the routing table: an object mapping values of the --route selector "+
+                        "to JSON-RNC files (relative to the directory of the table)")
+    parser.add_argument("schema",help="name of file containing the schema (the fallback schema with --route)")
+    parser.add_argument("--memo",help="Cache the validation of the last N different records (keyed by their text) "+
+                        "so that repeated records are not validated again; the hit rates are given in the summary",type=int)
+    parser.add_argument("--memo-ref",help="Cache the validation of the values of this definition of the schema (keyed by their structure), "+
+                        "the messages being adapted to the place of the value; can be repeated; "+
+                        "the values of the last N (given by --memo, default 10000) are kept for each definition",action="append",default=[])
+    parser.add_argument("--record-timeout",help="Number of seconds of processor time allowed for validating a record; "+
+                        "records taking more time are reported as 'validation timeout' errors (not used with --stream)",type=float)
+    parser.add_argument("--only",help="Validate only this subtree of the records, given as a list of keys separated by slashes as for -id "+
+                        "(e.g. '_id/$oid'); the other fields are not validated; can be repeated",action="append",default=[])
+    parser.add_argument("--skip",help="Do not validate this subtree of the records (which becomes optional), given as for --only; "+
+                        "can be repeated",action="append",default=[])
+    parser.add_argument("--explain",help="Instead of validating, output the validation plan of the schema (after --only and --skip) "+
+                        "with estimated costs in text or json format",choices=["text","json"])
+    parser.add_argument("--jobs","-j",help="Number of processes validating the files in parallel when many files are given "+
+                        "(default: number of processors)",type=int,default=os.cpu_count())
+    parser.add_argument("json_file",help="names of the JSON files to validate or glob patterns (e.g. 'shards/*.jsonl'); "+
+                        "many files are validated in a batch with a summary for each file and aggregated statistics",nargs='*')
     args=parser.parse_args()
+    jsonFiles=expandFiles(args.json_file)
+    inBatch=len(jsonFiles)>1 or any(glob.has_magic(f) for f in args.json_file)
+    args.json_file=jsonFiles[0] if len(jsonFiles)==1 and not inBatch else None
     if args.json_file != None and args.json_file.endswith(".json"): ## always split when dealing with .json file
         args.split=True
     if args.debug : 
         traceRead=True
+        ValidateJsonObject.traceValidate=True
+        ValidateJsonObject.outputBufferSize=0 # keep messages in sync with the traces
+    ValidateJsonObject.outputFormat=args.output_format
+    engine=args.engine
+    if args.follow and engine=="columnar": # a batch would delay the verdicts of the lines appended
+        engine="object"
+    batchSize=args.batch_size
+    fusedMessages=not(args.nolog) or args.stats
+    if args.follow and (args.json_file==None or args.slurp or args.split):
+        print ("--follow needs the name of a JSON lines file and cannot be used with --slurp or --split")
+        exit(1)
+    if args.stream and (args.follow or args.valid_out or args.invalid_out or args.quarantine):
+        print ("--stream cannot be used with --follow, --valid-out, --invalid-out or --quarantine")
+        exit(1)
+    if inBatch and (args.follow or args.valid_out or args.invalid_out or args.quarantine or args.sed_file):
+        print ("many files cannot be validated with --follow, --valid-out, --invalid-out, --quarantine or --sed-file")
+        exit(1)
+    if (args.route==None)!=(args.routes==None) or (args.route!=None and args.stream):
+        print ("--route and --routes must be used together and cannot be used with --stream")
+        exit(1)
+    ValidateJsonObject.topSize=args.top
+    ValidateJsonObject.exactPaths=args.exact_paths
+    ValidateJsonObject.errorTable=TopCounts()
+    if args.record_timeout!=None:
+        if not hasattr(signal,"setitimer"):
+            print ("--record-timeout is not available on this platform")
+            exit(1)
+        recordTimeout=args.record_timeout
+    followPoll=args.poll
+    followEvery=args.every
+    followStats=args.stats
     schema = getSchema(args.schema)
+    if schema!=None and args.route!=None:
+        routing=getRouting(args.route,args.routes,schema)
+        if routing==None: schema=None
+    unprojected={} # schemas before their projection by the id of their projection, for --explain
+    if schema!=None and len(args.only)+len(args.skip)>0:
+        projected={} # projections of the schemas by their id, so that a schema shared by routes is projected once
+        unmatched=None
+        for s in [schema]+([] if routing==None else list(routing["routes"].values())):
+            if id(s) not in projected:
+                (projected[id(s)],notFound)=projectSchema(s,args.only,args.skip)
+                unprojected[id(projected[id(s)])]=s
+                unmatched=set(notFound) if unmatched==None else unmatched&set(notFound)
+        if len(unmatched)>0:
+            sys.stderr.write("paths not found in the schema: "+", ".join(sorted(unmatched))+"\n")
+        if routing!=None:
+            routing["fallback"]=projected[id(routing["fallback"])]
+            routing["routes"]={value:projected[id(s)] for (value,s) in routing["routes"].items()}
+        schema=projected[id(schema)]
+    if schema!=None: # warn about patterns that could stall the validation
+        schemas=[schema]+([] if routing==None else list({id(s):s for s in routing["routes"].values()}.values()))
+        for (path,pattern,risks) in [risky for s in schemas for risky in riskyPatterns(s)]:
+            sys.stderr.write("risky pattern at %s: %s: %s%s\n"%(path,pattern,", ".join(risks),
+                             "" if recordTimeout!=None else " (consider --record-timeout)"))
+    if schema!=None and args.explain!=None:
+        printExplanation(sys.stdout,explainSchema(schema,unprojected.get(id(schema))),args.explain,args.schema)
+        if routing!=None:
+            for (value,s) in routing["routes"].items():
+                printExplanation(sys.stdout,explainSchema(s,unprojected.get(id(s))),args.explain,args.schema+" for route "+value)
+        exit(0)
+    if schema!=None and len(args.memo_ref)>0:
+        schemas=[schema]+([] if routing==None else list({id(s):s for s in routing["routes"].values()}.values()))
+        unknown=set(args.memo_ref)
+        for s in schemas:
+            unknown&=set(memoizeRefs(s,args.memo_ref,args.memo or 10000))
+        if len(unknown)>0:
+            print ("no definition for --memo-ref: "+", ".join(sorted(unknown)))
+            schema=None
+    if schema!=None: # references linked once instead of replaced while validating the first records, the schemas are then read-only
+        optimized={}
+        for s in [schema]+([] if routing==None else list(routing["routes"].values())):
+            if id(s) not in optimized:
+                optimized[id(s)]=optimizeSchema(s)
+        if routing!=None:
+            routing["fallback"]=optimized[id(routing["fallback"])]
+            routing["routes"]={value:optimized[id(s)] for (value,s) in routing["routes"].items()}
+        schema=optimized[id(schema)]
+    if schema!=None and args.memo:
+        recordMemo=LruCache(args.memo,"records")
     if schema!=None:
-        if args.slurp:
-            nbInvalid = validateStream(schema,args.id,[open(args.json_file,"r").read()],not(args.nolog))
-        elif args.split:
-            nbInvalid=validateObjects(schema,args.id,args.json_file,not(args.nolog))
+        bufferSize=1<<20
+        validOut     =open(args.valid_out,  "wb",buffering=bufferSize) if args.valid_out!=None   else None
+        invalidOut   =open(args.invalid_out,"wb",buffering=bufferSize) if args.invalid_out!=None else None
+        quarantineOut=open(args.quarantine, "wb",buffering=bufferSize) if args.quarantine!=None  else None
+        ValidateJsonObject.sedIds=args.sed or args.sed_file!=None
+        if args.sed_file!=None:
+            ValidateJsonObject.sedOutput=open(args.sed_file,"w")
+        elif args.sed and not(inBatch): # the ranges are kept in a temporary file until they are output
+            ValidateJsonObject.sedOutput=tempfile.TemporaryFile("w+",encoding="utf-8")
+            ValidateJsonObject.sedCopied=True
+        mode="stream" if args.stream else "slurp" if args.slurp else "split" if args.split else None
+        if inBatch:
+            nbInvalid=validateBatch(schema,args.id,jsonFiles,not(args.nolog),mode,args.sed,args.jobs)
+            if routing!=None:
+                printRouteStatistics()
+        elif args.follow:
+            nbInvalid=validateStream(schema,args.id,followLines(args.json_file),not(args.nolog))
         else:
-            nbInvalid=validateLines(schema,args.id,args.json_file,not(args.nolog))
+            nbInvalid=validateFile(schema,args.id,args.json_file,not(args.nolog),mode or "lines")
+        for out in [validOut,invalidOut,quarantineOut]:
+            if out!=None: out.close()
         if args.stats:
-            printErrorStatistics()
-        if args.sed:
+            printRouteErrorStatistics() if routing!=None else printErrorStatistics()
+        if (args.sed or args.sed_file!=None) and not(inBatch): # given for each file in a batch
             printErrorIdList()
+        if ValidateJsonObject.sedOutput!=None:
+            ValidateJsonObject.sedOutput.close()
         exit(nbInvalid) # return the number of errors but in Linux it is given modulo 256...
 
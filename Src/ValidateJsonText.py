@@ -0,0 +1,216 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Validation of the text of a JSON object according to a JSON-rnc schema
+###  the text is scanned and checked against the schema at the same time, without building the Python object:
+###  the scan stops at the first error so that invalid records are rejected early
+###  and the memory used does not depend on the size of the record
+########################################################################
+
+import re,json
+from json.decoder import scanstring
+from json.scanner import NUMBER_RE
+import ValidateJsonObject
+from ValidateJsonObject import RefTraversal,refSchema,validateSimpleType,validateFacets
+
+traceText=False
+
+WHITESPACE=re.compile(r'[ \t\n\r]*')
+SIMPLE_TYPES=frozenset(["integer","number","boolean","string","null"])
+LITERALS=[("true",True),("false",False),("null",None),("NaN",float("nan")),("Infinity",float("inf")),("-Infinity",float("-inf"))]
+
+# raised at the first error found in the text
+class Reject(Exception):
+    pass
+
+def badJson(mess,s,i):
+    return json.JSONDecodeError(mess,s,i)
+
+###
+#  scan a value that is neither an object nor an array starting at position i of s
+#  returns (value,end)
+def scanScalar(s,i):
+    c=s[i:i+1]
+    if c=='"':
+        return scanstring(s,i+1)
+    m=NUMBER_RE.match(s,i)
+    if m!=None:
+        (integer,frac,exp)=m.groups()
+        if frac or exp:
+            return (float(integer+(frac or '')+(exp or '')),m.end())
+        return (int(integer),m.end())
+    for (lit,value) in LITERALS:
+        if s.startswith(lit,i):
+            return (value,i+len(lit))
+    raise badJson("Expecting value",s,i)
+
+###
+#  check the value starting at position i of s against the schema
+#  idPath: the remaining keys of the id selector when the value is on its path, otherwise None
+#  idValue: list in which the value of the id is saved when it is found
+#  refs: references already traversed (see ValidateJsonObject.RefTraversal)
+#  returns the position following the value, raises Reject at the first error
+def scanValue(s,i,schema,idPath,idValue,refs):
+    if traceText: print ("$$scanValue:%d:%s"%(i,ValidateJsonObject.showVal(schema)))
+    if "$memo" in schema: # memoized definition (see ValidateJsonObject.memoizeRefs), the text is scanned anyway
+        return scanValue(s,i,schema["schema"],idPath,idValue,refs)
+    if "oneOf" in schema:
+        for alt in schema["oneOf"]:
+            try:
+                return scanValue(s,i,alt,idPath,idValue,refs)
+            except Reject:
+                pass
+        raise Reject()
+    if "type" in schema:
+        theType=schema["type"]
+        c=s[i:i+1]
+        if theType in SIMPLE_TYPES:
+            if c=="{" or c=="[":
+                raise Reject()
+            (value,end)=scanScalar(s,i)
+            if validateSimpleType([],theType,value)!="" or validateFacets([],schema,value)!="":
+                raise Reject()
+            if idPath!=None and len(idPath)==0: idValue.append(value)
+            return end
+        if theType=="object":
+            if c!="{":
+                raise Reject()
+            addProps=schema.get("additionalProperties")
+            if addProps!=None and type(addProps) is not bool:
+                (end,nbProps)=scanObject(s,i,lambda key:addProps,idPath,idValue,refs)
+            elif "properties" in schema:
+                if "required" not in schema:
+                    raise Reject()
+                props=schema["properties"]
+                required=schema["required"]
+                openObject=schema.get("additionalProperties") is True # the other fields are not validated
+                found=set()
+                def propSchema(key):
+                    if key not in props:
+                        if openObject: return None
+                        raise Reject() # unexpected field
+                    found.add(key)
+                    return props[key]
+                (end,nbProps)=scanObject(s,i,propSchema,idPath,idValue,refs)
+                for field in required:
+                    if field not in found:
+                        raise Reject() # missing required field
+                return end # as in ValidateJsonObject, the number of properties is not checked with properties
+            else:
+                (end,nbProps)=scanObject(s,i,lambda key:None,idPath,idValue,refs)
+            if nbProps<schema.get("minProperties",nbProps) or nbProps>schema.get("maxProperties",nbProps):
+                raise Reject()
+            return end
+        if theType=="array":
+            if c!="[":
+                raise Reject()
+            items=schema.get("items")
+            (end,nbItems)=scanArray(s,i,items,refs)
+            if items!=None and (nbItems<schema.get("minItems",nbItems) or nbItems>schema.get("maxItems",nbItems)):
+                raise Reject()
+            return end
+        raise Reject() # unexpected type
+    if "$ref" in schema: # traversed as by ValidateJsonObject.validate
+        try:
+            linked=refSchema(schema)
+        except NameError: # reference not found
+            raise Reject()
+        refs.follow(schema)
+        return scanValue(s,i,linked,idPath,idValue,refs)
+    if len(schema)==0: # empty schema accepts any value
+        return skipValue(s,i,idPath,idValue)
+    raise Reject() # schema without type, oneOf nor $ref
+
+###
+#  scan the object starting at position i, checking each value against the schema returned by
+#  fieldSchema(key) (None for not checking it); raises KeyError on a duplicate key as json.loads does in ValidateJsonRnc
+#  returns (the position following the object, number of properties)
+def scanObject(s,i,fieldSchema,idPath,idValue,refs):
+    i=WHITESPACE.match(s,i+1).end()
+    keys=set()
+    if s[i:i+1]=="}":
+        return (i+1,0)
+    while True:
+        if s[i:i+1]!='"':
+            raise badJson("Expecting property name enclosed in double quotes",s,i)
+        (key,i)=scanstring(s,i+1)
+        if key in keys:
+            raise KeyError("duplicate key: "+key)
+        keys.add(key)
+        i=WHITESPACE.match(s,i).end()
+        if s[i:i+1]!=":":
+            raise badJson("Expecting ':' delimiter",s,i)
+        i=WHITESPACE.match(s,i+1).end()
+        schema=fieldSchema(key)
+        path=idPath[1:] if idPath!=None and len(idPath)>0 and idPath[0]==key else None
+        i=skipValue(s,i,path,idValue) if schema==None else scanValue(s,i,schema,path,idValue,refs)
+        i=WHITESPACE.match(s,i).end()
+        c=s[i:i+1]
+        if c=="}":
+            return (i+1,len(keys))
+        if c!=",":
+            raise badJson("Expecting ',' delimiter",s,i)
+        i=WHITESPACE.match(s,i+1).end()
+
+###
+#  scan the array starting at position i checking each element against items (None for not checking them)
+#  returns (the position following the array, number of elements)
+def scanArray(s,i,items,refs):
+    i=WHITESPACE.match(s,i+1).end()
+    if s[i:i+1]=="]":
+        return (i+1,0)
+    nb=0
+    while True:
+        i=skipValue(s,i,None,None) if items==None else scanValue(s,i,items,None,None,refs)
+        nb+=1
+        i=WHITESPACE.match(s,i).end()
+        c=s[i:i+1]
+        if c=="]":
+            return (i+1,nb)
+        if c!=",":
+            raise badJson("Expecting ',' delimiter",s,i)
+        i=WHITESPACE.match(s,i+1).end()
+
+###
+#  scan a value without checking it against a schema, only its syntax and the uniqueness of keys
+#  returns the position following the value
+def skipValue(s,i,idPath,idValue):
+    c=s[i:i+1]
+    if c=="{":
+        return scanObject(s,i,lambda key:None,idPath,idValue,None)[0]
+    if c=="[":
+        return scanArray(s,i,None,None)[0]
+    (value,end)=scanScalar(s,i)
+    if idPath!=None and len(idPath)==0: idValue.append(value)
+    return end
+
+###
+#  validate the text of a JSON record (str or bytes) according to a schema
+#  idSels: list of keys of the value identifying the record (None if not used)
+#  returns (True if valid, False if rejected, value of the id (None if not found) )
+#  raises ValueError when the text is not JSON and KeyError when an object has duplicate keys
+#  Once a record is rejected, the rest of its text is not looked at, so that a record both
+#  invalid and malformed can be reported as invalid. 
+#  refs: references traversed by the previous records of the file (see ValidateJsonObject.RefTraversal), None for a single record
+#  When restore is True, the references traversed for the first time while scanning a rejected record are
+#  forgotten so that ValidateJsonObject.validateObject produces the same messages for this record
+def validateText(text,schema,idSels=None,restore=False,refs=None):
+    if type(text) is bytes:
+        text=text.decode(json.detect_encoding(text),"surrogatepass")
+    ValidateJsonObject.rootSchema=schema # for the references of a schema that is not optimized
+    if refs==None:
+        refs=RefTraversal()
+    idValue=[]
+    refs.new.clear()
+    try:
+        i=WHITESPACE.match(text,0).end()
+        i=WHITESPACE.match(text,scanValue(text,i,schema,idSels,idValue,refs)).end()
+    except Reject:
+        if restore:
+            refs.forget()
+        return (False,idValue[0] if len(idValue)>0 else None)
+    except RecursionError:
+        raise badJson("Too deeply nested",text,0)
+    if i!=len(text):
+        raise badJson("Extra data",text,i)
+    return (True,idValue[0] if len(idValue)>0 else None)
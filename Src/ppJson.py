@@ -5,8 +5,6 @@
 ###  Guy Lapalme (lapalme@iro.umontreal.ca) March 2015
 ########################################################################
 
-import json
-
 ## to sort object fields without accents
 import unicodedata
 def remove_accents(input_str):
@@ -15,58 +13,71 @@ def remove_accents(input_str):
 
 #### prettyprint a JSON in more compact format
 ##   that I find more readable
+##   the output is written as it is produced, in chunks of at most 4096 strings
 def ppJson(file,obj,level=0,sortkeys=False,max_length=100):
-    # auxiliary function that creates a string
-    def pp(obj,level,res):
-        def out(s):
-            nonlocal res
-            res += s
+    chunks=[]
+    def out(s):
+        chunks.append(s)
+        if len(chunks)>=4096:
+            file.write("".join(chunks))
+            chunks.clear()
 
-        def quoted(s):
-            if '\\' in s: s = s.replace('\\', '\\\\')
-            if '"' in s: s = s.replace('"', '\\"')
-            if '\n' in s: s = s.replace('\n', '\\n')
-            return '"' + s + '"'
+    def quoted(s):
+        if '\\' in s: s = s.replace('\\', '\\\\')
+        if '"' in s: s = s.replace('"', '\\"')
+        if '\n' in s: s = s.replace('\n', '\\n')
+        return '"' + s + '"'
 
+    # string for a value that is neither an object nor an array
+    def scalar(obj):
         if isinstance(obj,str):
-            out(quoted(obj))
+            return quoted(obj)
         elif obj==None:
-            out("null")
+            return "null"
         elif type(obj) is bool:
-            out("true" if obj else "false")
+            return "true" if obj else "false"
         elif isinstance(obj,(int,float)):
-            out(str(obj))
-        elif type(obj) is dict:
+            return str(obj)
+        return ""
+
+    def pp(obj,level):
+        if type(obj) is dict:
             keys=list(obj.keys())
             if sortkeys: keys.sort(key=remove_accents)
-            out("{"+
-                (",\n"+(level+1)*" ").join(map(lambda key:quoted(key)+":"+pp(obj[key],level+1+len(key)+3,""),keys))
-                +"}")
+            out("{")
+            sep=",\n"+(level+1)*" "
+            for i,key in enumerate(keys):
+                if i>0: out(sep)
+                out(quoted(key)+":")
+                pp(obj[key],level+1+len(key)+3)
+            out("}")
         elif type(obj) is list:
-            children = list(map(lambda elem:pp(elem,level+1,"") ,obj))
             indent = any(map(lambda elem: isinstance(elem,(list,dict)),obj))
             if not indent: # check if all children fit on the same line
                 # sum of (length of each string + 2 quotes) + number of commas + level+2
-                if sum(map(lambda e:len(e)+2,children))+len(list(children))+level+2 > max_length:
-                    indent = True
-            out("["+ ((",\n"+(level+1)*" ") if indent else ",").join(children)+"]")
-        return res
-    file.write(pp(obj,level,""))
-    file.write("\n")
+                # stop looking at the children as soon as the line is too long
+                length=len(obj)+level+2
+                for elem in obj:
+                    length+=len(scalar(elem))+2
+                    if length > max_length:
+                        indent = True
+                        break
+            out("[")
+            sep=(",\n"+(level+1)*" ") if indent else ","
+            for i,elem in enumerate(obj):
+                if i>0: out(sep)
+                pp(elem,level+1)
+            out("]")
+        elif not isinstance(obj,(list,dict)):
+            out(scalar(obj))
+    pp(obj,level)
+    del pp # break the reference cycle of the recursive closure that keeps file alive
+    chunks.append("\n")
+    file.write("".join(chunks))
 
 if __name__ == '__main__':
     import sys
-    content = sys.stdin.read().strip()
-    try: # reading the whole file in case it is a single valid JSON
-        ppJson(sys.stdout,json.loads(content))
-    except json.JSONDecodeError as e:
-        # read many json objects from stdin, each object possibly spanning more than one line
-        # taken from: http://stackoverflow.com/questions/20400818/python-trying-to-deserialize-multiple-json-objects-in-a-file-with-each-object-s
-        for line in content.split("\n"):
-            while True:
-                try:
-                    obj=json.loads(line)
-                    ppJson(sys.stdout,obj)
-                    break
-                except:
-                    line += next(sys.stdin)
+    from SplitJson import jsonValues
+    # read many json objects from stdin, each object possibly spanning more than one line
+    for obj in jsonValues(sys.stdin):
+        ppJson(sys.stdout,obj)
@@ -0,0 +1,66 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Benchmark of the columnar engine on flat records
+###  records with string fields of bounded length and numeric fields within a range, one out of 100 invalid,
+###  are decoded then validated one at a time (as by the object engine) or by batches checked column by column;
+###  the time per record is shown for each number of records
+###  e.g.  ./benchColumns.py --fields 20 10000 100000
+########################################################################
+
+import sys,os,time,json,random,argparse
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","Src"))
+from ValidateJsonObject import checkObject
+from OptimizeSchema import optimizeSchema
+from ValidateColumns import recordPlan,checkBatches
+import ValidateColumns
+
+## schema of records with n fields (the odd ones being optional) and n records in JSON
+def flatRecords(nbFields,n):
+    keys=["field%d"%i for i in range(nbFields)]
+    props={key:{"type":"string","minLength":2,"maxLength":40} if i%2==0 else {"type":"integer","minimum":0,"maximum":1000}
+           for (i,key) in enumerate(keys)}
+    schema={"$schema":"http://json-schema.org/draft-07/schema#","definitions":{},
+            "type":"object","properties":props,"required":keys[::2],"additionalProperties":False}
+    random.seed(1)
+    records=[]
+    for no in range(n):
+        record={key:("x"*random.randint(2,40) if i%2==0 else random.randint(0,1000))
+                for (i,key) in enumerate(keys) if i%2==0 or random.random()<0.7}
+        if no%100==50:
+            record[keys[0]]="x"
+        records.append(json.dumps(record))
+    return (schema,records)
+
+def byRecord(schema,records):
+    return sum([checkObject(json.loads(text),schema)!="" for text in records])
+
+def byColumns(schema,records,size):
+    plan=recordPlan(schema)
+    return sum([checkObject(obj,schema)!="" for (text,obj,checked) in checkBatches(records,plan,size,json.loads) if not(checked)])
+
+## best time of fn over repeat runs and its result
+def best(fn,repeat):
+    times=[]
+    for i in range(repeat):
+        start=time.perf_counter()
+        result=fn()
+        times.append(time.perf_counter()-start)
+    return (min(times),result)
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description="Time the validation of flat records one at a time and by columns")
+    parser.add_argument("--fields",help="number of fields of the records (default 20)",type=int,default=20)
+    parser.add_argument("--batch-size",help="number of records of a batch (default 10000)",type=int,default=10000)
+    parser.add_argument("--repeat",help="number of runs, the best time is kept (default 3)",type=int,default=3)
+    parser.add_argument("sizes",help="numbers of records (default: 10000 100000)",type=int,nargs='*')
+    args=parser.parse_args()
+    print ("NumPy "+("not installed" if ValidateColumns.numpy==None else ValidateColumns.numpy.__version__))
+    print ("%10s %14s %14s %10s %s"%("records","record µs/rec","columns µs/rec","speedup","invalid"))
+    for n in args.sizes or [10000,100000]:
+        (schema,records)=flatRecords(args.fields,n)
+        schema=optimizeSchema(schema)
+        (tRecord,invalid)=best(lambda:byRecord(schema,records),args.repeat)
+        (tColumns,invalidColumns)=best(lambda:byColumns(schema,records,args.batch_size),args.repeat)
+        print ("%10d %14.2f %14.2f %9.2fx %d %s"%(n,tRecord*1e6/n,tColumns*1e6/n,tRecord/tColumns,invalid,
+                                                  "" if invalid==invalidColumns else "(%d by columns)"%invalidColumns))
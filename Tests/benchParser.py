@@ -0,0 +1,48 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Benchmark of the JSON-RNC parser on generated schemas
+###  a schema with n definitions, as generated from a data catalog, is parsed for each size given
+###  and the time per definition is shown: it should stay about the same when the size grows
+###  with --errors, one definition out of 100 is malformed to measure the error recovery
+###  e.g.  ./benchParser.py 1000 10000 100000
+########################################################################
+
+import sys,os,time,io,argparse
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","Src"))
+from ParseJsonRnc import parseJsonRnc
+
+## definition number i of a generated schema, it refers to the following definitions
+def generateDef(i,n,error):
+    ref1="def%d"%((i+1)%n)
+    ref2="def%d"%((i*7+3)%n)
+    if error:
+        return "def%d = { id : string, : integer, ( code ? /[A-Z]+/ }\n"%i
+    if i%3==0:
+        return 'def%d = { id : string, "full name" ? : string @(maxLength=80), count : integer @(minimum=0),\n'%i+\
+               '         code ? : /[A-Z]{2}[0-9]+/, parts ? : [%s] @(maxItems=10) }\n'%ref1
+    if i%3==1:
+        return "def%d = %s | %s | null   # alternatives\n"%(i,ref1,ref2)
+    return "def%d = { *: %s } @(minProperties=1)\n"%(i,ref1)
+
+def generateSchema(n,errors):
+    return "start = [def0]\n"+"".join([generateDef(i,n,errors and i%100==50) for i in range(n)])
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description="Time the parsing of generated JSON-RNC schemas with the given numbers of definitions")
+    parser.add_argument("--errors",help="make one definition out of 100 malformed",action="store_true")
+    parser.add_argument("sizes",help="numbers of definitions (default: 1000 10000 100000)",type=int,nargs='*')
+    args=parser.parse_args()
+    print ("%10s %10s %10s %12s %s"%("defs","chars","time (s)","µs/def","result"))
+    for n in args.sizes or [1000,10000,100000]:
+        text=generateSchema(n,args.errors)
+        stdout=sys.stdout
+        sys.stdout=io.StringIO() # error messages are not shown
+        start=time.perf_counter()
+        try:
+            schema=parseJsonRnc(io.StringIO(text))
+        finally:
+            sys.stdout=stdout
+        elapsed=time.perf_counter()-start
+        result="%d errors"%schema if type(schema) is int else "%d definitions"%len(schema["definitions"])
+        print ("%10d %10d %10.3f %12.2f %s"%(n,len(text),elapsed,elapsed*1e6/n,result))
@@ -0,0 +1,54 @@
+#!/usr/local/bin/python3
+# coding=utf-8
+
+####### Benchmark of the validation of wide objects and of large arrays
+###  the time per key of objects with n keys (half of them required) and the time per element
+###  of arrays of n elements should stay about the same when n grows
+###  e.g.  ./benchValidate.py --keys 10 100 1000 10000 --elements 1000 1000000
+########################################################################
+
+import sys,os,time,argparse
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","Src"))
+from ValidateJsonObject import checkObject
+from OptimizeSchema import optimizeSchema
+
+## schema of objects with n integer keys, the even ones being required, and an object with all of them
+def wideObject(n):
+    keys=["key%d"%i for i in range(n)]
+    schema={"$schema":"http://json-schema.org/draft-07/schema#","definitions":{},
+            "type":"object","properties":{key:{"type":"integer","minimum":0} for key in keys},
+            "required":keys[::2],"additionalProperties":False}
+    return (schema,{key:i for (i,key) in enumerate(keys)})
+
+## schema of arrays of integers and an array of n elements
+def largeArray(n):
+    schema={"$schema":"http://json-schema.org/draft-07/schema#","definitions":{},
+            "type":"array","items":{"type":"integer","minimum":0}}
+    return (schema,list(range(n)))
+
+## time of the validation of obj (the best of repeat) per unit
+def timeValidation(schema,obj,n,repeat):
+    schema=optimizeSchema(schema)
+    best=None
+    for i in range(repeat):
+        start=time.perf_counter()
+        mess=checkObject(obj,schema)
+        elapsed=time.perf_counter()-start
+        best=elapsed if best==None else min(best,elapsed)
+    return (best,best*1e6/n,mess)
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description="Time the validation of objects with many keys and of arrays with many elements")
+    parser.add_argument("--keys",help="numbers of keys of the objects (default: 10 100 1000 10000)",type=int,nargs='*',
+                        default=[10,100,1000,10000])
+    parser.add_argument("--elements",help="numbers of elements of the arrays (default: 1000 10000 100000 1000000 10000000)",
+                        type=int,nargs='*',default=[1000,10000,100000,1000000,10000000])
+    parser.add_argument("--repeat",help="number of validations of each value, the best time is kept (default 3)",type=int,default=3)
+    args=parser.parse_args()
+    print ("%10s %10s %12s %12s %s"%("","n","time (s)","µs/unit","valid"))
+    for n in args.keys:
+        (best,perUnit,mess)=timeValidation(*wideObject(n),n,args.repeat)
+        print ("%10s %10d %12.4f %12.3f %s"%("keys",n,best,perUnit,mess==""))
+    for n in args.elements:
+        (best,perUnit,mess)=timeValidation(*largeArray(n),n,args.repeat)
+        print ("%10s %10d %12.4f %12.3f %s"%("elements",n,best,perUnit,mess==""))
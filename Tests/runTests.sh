@@ -20,5 +20,34 @@ done
 if [ $? != 0 ]; then
     echo 'no match for: TestSplitter'
 fi
-echo "Test complete for `expr ${#testFiles[@]} + 1` files"
+# risky patterns reported when the schema is loaded and their complexity in the validation plan
+../Src/ValidateJsonRnc.py --explain text TestPatterns.jsonrnc 2>&1 | cmp TestPatterns.explain.out
+if [ $? != 0 ]; then
+    echo 'no match for: TestPatterns explanation'
+fi
+# definitions not used by a projection
+../Src/ValidateJsonRnc.py --explain text --only person/name TestMemo.jsonrnc | cmp TestMemo.explain.out
+if [ $? != 0 ]; then
+    echo 'no match for: TestMemo explanation with --only'
+fi
+# the messages must be the same with and without memoization
+../Src/ValidateJsonRnc.py --stats --memo 10 TestMemo.jsonrnc TestMemo.jsonl | grep -v "^Memoization$\|lookups" | cmp TestMemo.out
+if [ $? != 0 ]; then
+    echo 'no match for: TestMemo with --memo'
+fi
+../Src/ValidateJsonRnc.py --stats --memo-ref person --memo-ref address TestMemo.jsonrnc TestMemo.jsonl | grep -v "^Memoization$\|lookups" | cmp TestMemo.out
+if [ $? != 0 ]; then
+    echo 'no match for: TestMemo with --memo-ref'
+fi
+# recursive definitions
+../Src/ValidateJsonRnc.py --stats --memo-ref tree --memo-ref list --memo-ref value Tree.jsonrnc TreeMemo.jsonl | grep -v "^Memoization$\|lookups" | cmp TreeMemo.out
+if [ $? != 0 ]; then
+    echo 'no match for: TreeMemo with --memo-ref'
+fi
+# the elements of a top-level array validated one at a time, with the same paths
+../Src/ValidateJsonRnc.py --stats --stream TestStream.jsonrnc TestStream.json | cmp TestStream.stream.out
+if [ $? != 0 ]; then
+    echo 'no match for: TestStream with --stream'
+fi
+echo "Test complete for `expr ${#testFiles[@]} + 7` files"
 